@@ -0,0 +1,151 @@
+import time
+from collections import namedtuple
+
+import cv2
+
+# The video servers call eventlet.monkey_patch(), which turns threading.Thread
+# into a green thread. cap.read() is a blocking C call, so a green grabber would
+# stall the whole eventlet hub. Always use a real OS thread for capture.
+try:
+    from eventlet.patcher import original as _original
+    threading = _original("threading")
+    _sleep = _original("time").sleep
+except ImportError:
+    import threading
+    _sleep = time.sleep
+
+# A captured frame together with the time it was read and its capture order.
+Frame = namedtuple("Frame", ["image", "timestamp", "seq"])
+
+
+class FrameGrabber:
+    def __init__(self, cap, buffer_size=2, threaded=None):
+        """
+        Reads frames from a capture device on a background thread.
+        Only the newest frames are kept, so consumers never see stale frames
+        queued up inside OpenCV.
+        :param cap: An opened cv2.VideoCapture or FrameSource.
+        :param buffer_size: Number of ring buffer slots to keep.
+        :param threaded: Capture on a background thread. Defaults to True for live
+            sources and False for replay sources, which are then read in step with
+            the caller so every frame is processed exactly once.
+        """
+        self.cap = cap
+        self.threaded = getattr(cap, "live", True) if threaded is None else threaded
+        self.exhausted = False
+        # Keep the driver-side queue as short as possible
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self.buffer_size = max(1, buffer_size)
+        self.ring = [None] * self.buffer_size
+        self.write_index = 0
+
+        self.frames_captured = 0
+        self.dropped_frames = 0
+        self.read_failures = 0
+        self.last_consumed_seq = -1
+
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Starts the capture thread. Returns self so it can be chained."""
+        if self.running:
+            return self
+        self.running = True
+        if not self.threaded:
+            return self
+        self.thread = threading.Thread(target=self._capture_loop, name="frame-grabber", daemon=True)
+        self.thread.start()
+        return self
+
+    def _capture_loop(self):
+        while self.running:
+            ret, image = self.cap.read()
+            timestamp = time.time()
+            if not ret:
+                self.read_failures += 1
+                _sleep(0.01)
+                continue
+
+            with self.lock:
+                latest = self.ring[(self.write_index - 1) % self.buffer_size]
+                # The previous newest frame was never handed out, so it is lost
+                if latest is not None and latest.seq > self.last_consumed_seq:
+                    self.dropped_frames += 1
+
+                self.ring[self.write_index] = Frame(image, timestamp, self.frames_captured)
+                self.write_index = (self.write_index + 1) % self.buffer_size
+                self.frames_captured += 1
+                self.new_frame.notify_all()
+
+    def read_latest(self, newer_than=-1):
+        """
+        Returns the newest frame without blocking.
+        :param newer_than: Sequence number of the last frame the caller used.
+        :return: A Frame, or None if nothing newer than newer_than is available.
+        """
+        if not self.threaded:
+            return self._read_direct()
+        with self.lock:
+            latest = self.ring[(self.write_index - 1) % self.buffer_size]
+            if latest is None or latest.seq <= newer_than:
+                return None
+            self.last_consumed_seq = max(self.last_consumed_seq, latest.seq)
+            return latest
+
+    def _read_direct(self):
+        """Reads the next frame in the caller's thread (replay sources)."""
+        if self.exhausted:
+            return None
+        ret, image = self.cap.read()
+        if not ret:
+            self.exhausted = True
+            return None
+        frame = Frame(image, time.time(), self.frames_captured)
+        self.frames_captured += 1
+        self.last_consumed_seq = frame.seq
+        return frame
+
+    def wait_for_frame(self, newer_than=-1, timeout=None):
+        """
+        Blocking variant of read_latest for callers outside the eventlet loop.
+        Waits until a frame newer than newer_than arrives or the timeout expires.
+        """
+        if not self.threaded:
+            return self._read_direct()
+        with self.new_frame:
+            self.new_frame.wait_for(
+                lambda: self.frames_captured - 1 > newer_than or not self.running,
+                timeout=timeout,
+            )
+        return self.read_latest(newer_than)
+
+    def stats(self):
+        """Returns capture counters for logging."""
+        return {
+            "captured": self.frames_captured,
+            "dropped": self.dropped_frames,
+            "read_failures": self.read_failures,
+        }
+
+    def get(self, prop):
+        """Passes property lookups through to the capture device."""
+        return self.cap.get(prop)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def stop(self):
+        """Stops the capture thread and releases the device."""
+        self.running = False
+        with self.new_frame:
+            self.new_frame.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        self.cap.release()
+
+    release = stop
@@ -0,0 +1,256 @@
+import math
+import os
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameSource:
+    """
+    Common interface for anything the trackers can read frames from.
+    Mirrors the parts of cv2.VideoCapture the trackers use (read, get, set,
+    isOpened, release) so a source can be dropped in wherever a capture was.
+    """
+    # Live sources produce frames on their own clock and should be read through
+    # a FrameGrabber thread. Replay sources are read synchronously so runs are
+    # deterministic.
+    live = False
+
+    def read(self):
+        raise NotImplementedError
+
+    def get(self, prop):
+        return 0
+
+    def set(self, prop, value):
+        return False
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    live = True
+
+    def __init__(self, index=0, api_preference=None, width=None, height=None):
+        """
+        Opens a live camera.
+        :param index: Camera index passed to cv2.VideoCapture.
+        :param api_preference: Optional capture backend, e.g. cv2.CAP_DSHOW.
+        :param width: Requested frame width.
+        :param height: Requested frame height.
+        """
+        if api_preference is None:
+            self.cap = cv2.VideoCapture(index)
+        else:
+            self.cap = cv2.VideoCapture(index, api_preference)
+        if width:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    def read(self):
+        return self.cap.read()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class ReplaySource(FrameSource):
+    def __init__(self, rate=None, loop=False):
+        """
+        Base class for sources that replay recorded or generated frames.
+        :param rate: Frames per second to replay at, or None to run as fast as possible.
+        :param loop: Start again from the first frame when the end is reached.
+        """
+        self.rate = rate
+        self.loop = loop
+        self.position = 0
+        self.start_time = None
+
+    def _pace(self):
+        """Sleeps until the current frame is due when replaying at a fixed rate."""
+        if not self.rate:
+            return
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        due = self.start_time + self.position / self.rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _frame_at(self, index):
+        """Returns the frame at index, or None when past the end."""
+        raise NotImplementedError
+
+    def _rewind(self):
+        pass
+
+    def read(self):
+        frame = self._frame_at(self.position)
+        if frame is None and self.loop and self.position > 0:
+            self._rewind()
+            self.position = 0
+            self.start_time = None
+            frame = self._frame_at(self.position)
+        if frame is None:
+            return False, None
+        self._pace()
+        self.position += 1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        if prop == cv2.CAP_PROP_FPS:
+            return self.rate or 0
+        return 0
+
+
+class VideoFileSource(ReplaySource):
+    def __init__(self, path, rate=None, loop=False):
+        """
+        Replays a video file.
+        :param path: Path to the video file.
+        """
+        super().__init__(rate, loop)
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            print(f"Error: Could not open video file {path}")
+
+    def _frame_at(self, index):
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def _rewind(self):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def get(self, prop):
+        if prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT, cv2.CAP_PROP_FRAME_COUNT):
+            return self.cap.get(prop)
+        return super().get(prop)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirectorySource(ReplaySource):
+    def __init__(self, path, rate=None, loop=False):
+        """
+        Replays the images in a directory in file name order.
+        :param path: Directory containing the frames.
+        """
+        super().__init__(rate, loop)
+        self.path = path
+        self.files = sorted(
+            os.path.join(path, f) for f in os.listdir(path)
+            if f.lower().endswith(IMAGE_EXTENSIONS) and not f.startswith('.')
+        )
+        first = cv2.imread(self.files[0]) if self.files else None
+        self.frame_height, self.frame_width = first.shape[:2] if first is not None else (0, 0)
+
+    def _frame_at(self, index):
+        while index < len(self.files):
+            frame = cv2.imread(self.files[index])
+            if frame is not None:
+                return frame
+            print(f"Warning: Could not read {self.files[index]}")
+            del self.files[index]
+        return None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frame_width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frame_height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.files)
+        return super().get(prop)
+
+    def isOpened(self):
+        return len(self.files) > 0
+
+
+class SyntheticFaceSource(ReplaySource):
+    def __init__(self, width=320, height=240, num_frames=300, rate=None, loop=False, seed=0):
+        """
+        Generates a cartoon face moving along a smooth path over a noisy background.
+        Output is fully determined by the seed, so benchmark runs are repeatable.
+        :param num_frames: Number of frames before the stream ends.
+        :param seed: Seed for the background noise.
+        """
+        super().__init__(rate, loop)
+        self.frame_width = width
+        self.frame_height = height
+        self.num_frames = num_frames
+        rng = np.random.default_rng(seed)
+        self.background = rng.integers(40, 90, size=(height, width, 3), dtype=np.uint8)
+        self.face_radius = max(8, min(width, height) // 8)
+
+    def face_center(self, index):
+        """Ground-truth face centre for frame index."""
+        t = index / 30.0
+        x = self.frame_width / 2 + self.frame_width * 0.3 * math.sin(t * 1.3)
+        y = self.frame_height / 2 + self.frame_height * 0.25 * math.sin(t * 0.7 + 1.0)
+        return int(x), int(y)
+
+    def forehead_position(self, index):
+        """Ground-truth forehead point for frame index."""
+        x, y = self.face_center(index)
+        return x, y - self.face_radius // 2
+
+    def _frame_at(self, index):
+        if index >= self.num_frames:
+            return None
+        frame = self.background.copy()
+        x, y = self.face_center(index)
+        r = self.face_radius
+        cv2.ellipse(frame, (x, y), (r, int(r * 1.3)), 0, 0, 360, (150, 180, 220), -1)
+        cv2.circle(frame, (x - r // 3, y - r // 4), max(2, r // 8), (40, 40, 40), -1)
+        cv2.circle(frame, (x + r // 3, y - r // 4), max(2, r // 8), (40, 40, 40), -1)
+        cv2.ellipse(frame, (x, y + r // 2), (r // 3, r // 8), 0, 0, 180, (60, 60, 160), 2)
+        return frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frame_width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frame_height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.num_frames
+        return super().get(prop)
+
+
+def open_source(spec, width=None, height=None, api_preference=None, rate=None, loop=False):
+    """
+    Builds a frame source from a short description, for command line use.
+    :param spec: A camera index ("0"), "synthetic", an image directory or a video file path.
+    :param rate: Replay rate in frames per second for non-camera sources (None = unthrottled).
+    """
+    spec = str(spec)
+    if spec.isdigit():
+        return CameraSource(int(spec), api_preference, width, height)
+    if spec == "synthetic":
+        return SyntheticFaceSource(width or 320, height or 240, rate=rate, loop=loop)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, rate=rate, loop=loop)
+    return VideoFileSource(spec, rate=rate, loop=loop)
@@ -0,0 +1,97 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class FrameThumbnail:
+    def __init__(self, size=(32, 24), pixel_change_threshold=12):
+        """
+        Small grey thumbnail of a frame, for cheap tests of how much changed between
+        two frames. All buffers are allocated once and reused.
+        :param size: Thumbnail (width, height).
+        :param pixel_change_threshold: Grey level difference for a thumbnail pixel to
+            count as changed; filters out sensor noise.
+        """
+        self.size = size
+        self.pixel_change_threshold = pixel_change_threshold
+        self.gray = None
+        self.image = np.zeros(size[::-1], dtype=np.uint8)
+        self.diff = np.zeros_like(self.image)
+
+    def update(self, frame):
+        """Reduces a BGR frame into the thumbnail. Returns the thumbnail, which the next call overwrites."""
+        if self.gray is None or self.gray.shape != frame.shape[:2]:
+            self.gray = np.empty(frame.shape[:2], dtype=np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        cv2.resize(self.gray, self.size, dst=self.image, interpolation=cv2.INTER_AREA)
+        return self.image
+
+    def changed_percent(self, reference):
+        """Percentage of thumbnail pixels that differ from reference, a thumbnail of the same size."""
+        cv2.absdiff(self.image, reference, dst=self.diff)
+        cv2.threshold(self.diff, self.pixel_change_threshold, 255, cv2.THRESH_BINARY, dst=self.diff)
+        return 100.0 * cv2.countNonZero(self.diff) / self.diff.size
+
+
+class SceneChangeDetector:
+    def __init__(self, change_threshold=0.5, pixel_change_threshold=12, settle_frames=5,
+                 refresh_interval=5.0, thumb_size=(32, 24)):
+        """
+        Cheap test for whether a frame is worth processing at all.
+        Each frame is reduced to a small grey thumbnail and compared with the
+        thumbnail of the last frame that was processed. Comparing against that
+        reference instead of the previous frame also catches slow changes.
+        :param change_threshold: Percentage of thumbnail pixels that must change for
+            the frame to count as new.
+        :param pixel_change_threshold: Grey level difference for a thumbnail pixel to
+            count as changed; filters out sensor noise.
+        :param settle_frames: Unchanged frames still processed after the last change,
+            so the tracker sees a target come to rest.
+        :param refresh_interval: Seconds after which a frame is processed even if
+            nothing changed.
+        """
+        self.change_threshold = change_threshold
+        self.settle_frames = settle_frames
+        self.refresh_interval = refresh_interval
+
+        self.thumb = FrameThumbnail(thumb_size, pixel_change_threshold)
+        self.reference = np.zeros_like(self.thumb.image)
+        self.has_reference = False
+
+        self.quiet_frames = 0
+        self.last_processed = 0.0
+        self.static_frames = 0  # Frames skipped in total
+
+    @property
+    def static(self):
+        """True while frames are being skipped."""
+        return self.quiet_frames > self.settle_frames
+
+    def changed(self, frame, now=None):
+        """
+        :param frame: BGR frame.
+        :param now: Frame time in seconds, defaults to time.time().
+        :return: True if the frame should go through the full pipeline.
+        """
+        now = time.time() if now is None else now
+        self.thumb.update(frame)
+
+        if not self.has_reference:
+            self.has_reference = True
+            return self._process(now)
+
+        if self.thumb.changed_percent(self.reference) > self.change_threshold:
+            self.quiet_frames = 0
+            return self._process(now)
+
+        self.quiet_frames += 1
+        if not self.static or now - self.last_processed >= self.refresh_interval:
+            return self._process(now)
+        self.static_frames += 1
+        return False
+
+    def _process(self, now):
+        np.copyto(self.reference, self.thumb.image)
+        self.last_processed = now
+        return True
@@ -1,5 +1,10 @@
 import cv2
-from deepface import DeepFace
+from recognition.engine import RecognitionEngine
+
+# DeepFace VGG-Face embeddings of the Haar cascade crops. The model and cascade
+# load once and the reference folder is embedded and indexed once, instead of
+# DeepFace.find scanning it for every face of every frame.
+engine = RecognitionEngine("deepface", gallery_path="faces", model_name="VGG-Face")
 
 # Initialize webcam
 cap = cv2.VideoCapture(0)
@@ -14,30 +19,14 @@ while True:
         print("Failed to capture frame")
         break
 
-    # Convert to grayscale for better face detection
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    
-    # Load OpenCV's built-in face detector
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5, minSize=(30, 30))
-
-    for (x, y, w, h) in faces:
-        # Draw rectangle around detected face
-        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-
-        # Crop detected face
-        face_roi = frame[y:y + h, x:x + w]
-
-        try:
-            pass
-            # Perform face recognition
-            result = DeepFace.find(face_roi, db_path="faces", enforce_detection=False, silent=True)
-            if len(result) > 0 and not result[0].empty:
-                recognized_name = result[0]["identity"][0].split("/")[-1]
-                print(recognized_name)
-                cv2.putText(frame, recognized_name, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
-        except Exception as e:
-            print("DeepFace error:", e)
+    try:
+        faces = engine.recognize(frame)
+        engine.draw(frame, faces)
+        for face in faces:
+            if face.name != "Unknown":
+                print(face.name)
+    except Exception as e:
+        print("DeepFace error:", e)
 
     # Display the frame
     cv2.imshow("Face Recognition", frame)
@@ -1,46 +1,105 @@
 from simple_facerec import SimpleFacerec
 import cv2
 import numpy as np
+from capture.frame_grabber import FrameGrabber
+from capture.frame_source import CameraSource
+from headtracking.track_bank import TrackBank
+from recognition.gallery_watcher import GalleryWatcher
+from recognition.identity_cache import IdentityCache
+from recognition.recognition_worker import RecognitionWorker
 
 class FaceTracker:
-    def __init__(self):
+    def __init__(self, source=None, draw_overlays=True, watch_gallery=True, async_recognition=True):
         # Initialize face recognition
+        self.gallery_path = "faces/"  # Folder containing images of known people
         self.sfr = SimpleFacerec()
-        self.sfr.load_encoding_images("faces/")  # Folder containing images of known people
+        self.sfr.load_encoding_images(self.gallery_path)
+        # Picks up added, changed or removed images while running; only those get encoded
+        self.gallery_watcher = None
+        if watch_gallery:
+            self.gallery_watcher = GalleryWatcher(
+                self.gallery_path, lambda: self.sfr.reload_encoding_images(self.gallery_path)).start()
 
         self.frame_width, self.frame_height = 640, 480
-        self.center_x, self.center_y = self.frame_width // 2, self.frame_height // 2
         self.fire_radius = 30  # Fire detection radius
 
-        # Open webcam
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(3, self.frame_width)  # Set width
-        self.cap.set(4, self.frame_height)  # Set height
+        # Open webcam unless another frame source was given
+        if source is None:
+            source = CameraSource(0, width=self.frame_width, height=self.frame_height)
+        self.cap = source
+        self.frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or self.frame_width
+        self.frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or self.frame_height
+        self.center_x, self.center_y = self.frame_width // 2, self.frame_height // 2
+        self.grabber = FrameGrabber(self.cap).start()
+        self.last_seq = -1
+
+        # Persistent face tracks; the turret stays locked on one until it disappears
+        self.tracks = TrackBank()
+        # Who each track is; faces are only encoded for new tracks and periodic re-checks
+        self.identities = IdentityCache()
+        self.gallery = self.sfr.gallery
+        # Faces are encoded in a worker process and names attached when they arrive,
+        # so the frame loop runs at detection speed even while new faces are recognized
+        self.recognizer = RecognitionWorker().start() if async_recognition else None
+
+        # When False, frames are returned untouched and viewers draw last_metadata themselves
+        self.draw_overlays = draw_overlays
+        self.last_metadata = None
 
     def track_faces(self):
         """Processes a single frame and returns face tracking status."""
-        ret, frame = self.cap.read()
-        if not ret:
-            return None, None  # Return None if no frame is captured
-
-        # Draw crosshair
-        cv2.circle(frame, (self.center_x, self.center_y), radius=self.fire_radius, color=(255, 0, 0), thickness=1)
+        latest = self.grabber.read_latest(newer_than=self.last_seq)
+        if latest is None:
+            return None, None  # Return None if no new frame is available
+        self.last_seq = latest.seq
+        frame = latest.image
 
         # Detect faces
-        face_locations, face_names = self.sfr.detect_known_faces(frame)
+        face_locations = self.sfr.detect_faces(frame)
+
+        # Match faces to persistent tracks and pick the locked target
+        locations = np.asarray(face_locations, dtype=int).reshape(-1, 4)
+        boxes = locations[:, [3, 0, 1, 2]]  # (left, top, right, bottom)
+        centers = np.column_stack(((boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2))
+        track_ids = self.tracks.update(centers, latest.timestamp, boxes)
+        target_id = self.tracks.select_target((self.center_x, self.center_y))
+
+        # Recognize only the faces whose track has no trusted identity yet
+        if self.sfr.gallery is not self.gallery:
+            # The gallery was reloaded; names may have been added or removed
+            self.gallery = self.sfr.gallery
+            self.identities.clear()
+        box_list, id_list = boxes.tolist(), track_ids.tolist()
+        if self.recognizer is not None:
+            self.collect_identities(frame, box_list, id_list, latest.timestamp)
+        stale = [i for i, (box, track_id) in enumerate(zip(box_list, id_list))
+                 if self.identities.needs_recognition(track_id, box, frame, latest.timestamp)]
+        fresh = {}
+        if self.recognizer is not None:
+            # Tracks already waiting for a result are not sent again
+            stale = [i for i in stale if id_list[i] >= 0 and not self.recognizer.in_flight(id_list[i])]
+            if stale:
+                self.recognizer.submit(latest.seq, [id_list[i] for i in stale], [box_list[i] for i in stale],
+                                       self.sfr.face_crops(stale), latest.timestamp)
+        elif stale:
+            names, distances = self.sfr.recognize_faces(stale)
+            for i, name, distance in zip(stale, names, distances):
+                self.identities.update(id_list[i], box_list[i], frame, name, distance, latest.timestamp)
+                fresh[i] = name
+        face_names = [fresh.get(i, self.identities.name(track_id)) for i, track_id in enumerate(id_list)]
+        self.identities.prune(self.tracks.ids[self.tracks.active].tolist())
 
-        # Find the closest face to the center
         closest_face = None
         min_distance = float('inf')
-
-        for (top, right, bottom, left) in face_locations:
-            face_center_x = (left + right) // 2
-            face_center_y = (top + bottom) // 2
-            distance = np.sqrt((self.center_x - face_center_x) ** 2 + (self.center_y - face_center_y) ** 2)
-
-            if distance < min_distance:
-                min_distance = distance
-                closest_face = (left, top, right, bottom)
+        if target_id is not None:
+            # Box of the target centred on its filtered position, so it coasts through missed detections
+            slot = self.tracks.slot_of(target_id)
+            target_x, target_y = self.tracks.X[slot, :2]
+            left, top, right, bottom = self.tracks.boxes[slot].tolist()
+            half_w, half_h = (right - left) // 2, (bottom - top) // 2
+            closest_face = (int(target_x) - half_w, int(target_y) - half_h,
+                            int(target_x) + half_w, int(target_y) + half_h)
+            min_distance = np.hypot(self.center_x - target_x, self.center_y - target_y)
 
         # Fire status check
         status_text = ""
@@ -72,24 +131,55 @@ class FaceTracker:
                 if face_center_y > self.center_y:
                     status_text += " DOWN"
 
-        # Draw rectangles around all faces
-        for (top, right, bottom, left), name in zip(face_locations, face_names):
-            face_color = (0, 255, 0)  # Green by default
-            if closest_face and (left, top, right, bottom) == closest_face:
-                face_color = (0, 165, 255)  # Orange for closest face
-
-            cv2.rectangle(frame, (left, top), (right, bottom), face_color, 2)
-            cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, face_color, 2)
-
-        # Draw fire status
-        cv2.putText(frame, status_text, (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        faces = [{"box": box, "name": name, "id": track_id, "locked": track_id == target_id}
+                 for box, name, track_id in zip(boxes.tolist(), face_names, track_ids.tolist())]
+        self.last_metadata = {
+            "seq": latest.seq,
+            "timestamp": latest.timestamp,
+            "size": [self.frame_width, self.frame_height],
+            "center": [self.center_x, self.center_y],
+            "fire_radius": self.fire_radius,
+            "faces": faces,
+            "command": status_text,
+        }
+        if self.recognizer is not None:
+            self.last_metadata["recognition"] = self.recognizer.status()
+
+        if self.draw_overlays:
+            # Draw crosshair
+            cv2.circle(frame, (self.center_x, self.center_y), radius=self.fire_radius, color=(255, 0, 0), thickness=1)
+
+            # Draw rectangles around all faces
+            for face in faces:
+                left, top, right, bottom = face["box"]
+                face_color = (0, 255, 0)  # Green by default
+                if face["locked"]:
+                    face_color = (0, 165, 255)  # Orange for the locked target
+
+                cv2.rectangle(frame, (left, top), (right, bottom), face_color, 2)
+                cv2.putText(frame, f"{face['name']} #{face['id']}", (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, face_color, 2)
+
+            # Draw fire status
+            cv2.putText(frame, status_text, (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
 
         cv2.imshow("Face Recognition", frame)
         return frame, status_text
 
+    def collect_identities(self, frame, box_list, id_list, now):
+        """Stores the identities the recognition worker finished for tracks that still exist."""
+        current = dict(zip(id_list, box_list))
+        for result in self.recognizer.poll(self.sfr):
+            box = current.get(result.track_id)
+            if box is not None:
+                self.identities.update(result.track_id, box, frame, result.name, result.distance, now)
+
     def release(self):
         """Releases the camera and closes all OpenCV windows."""
-        self.cap.release()
+        if self.gallery_watcher is not None:
+            self.gallery_watcher.stop()
+        if self.recognizer is not None:
+            self.recognizer.stop()
+        self.grabber.stop()
         cv2.destroyAllWindows()
 
 
@@ -1,13 +1,25 @@
-
-from deepfacetest import FaceRecognition
+import sys
 import cv2
-tracker = FaceRecognition()
+from capture.frame_source import CameraSource
+from recognition.engine import RecognitionEngine
+
+# Backend from the command line: face_recognition, facenet or deepface
+engine = RecognitionEngine(sys.argv[1] if len(sys.argv) > 1 else "deepface", gallery_path="faces")
+watcher = engine.watch_gallery("faces")  # New or removed images take effect without a restart
+cap = CameraSource(0)
 
 while True:
-    frame, status = tracker.recognize_faces()
+    ret, frame = cap.read()
+    if not ret:
+        print("Failed to capture frame")
+        break
+    faces = engine.recognize(frame)
+    engine.draw(frame, faces)
     cv2.imshow("Face Recognition", frame)
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
 
-tracker.release()
\ No newline at end of file
+watcher.stop()
+cap.release()
+cv2.destroyAllWindows()
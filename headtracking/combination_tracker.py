@@ -1,37 +1,24 @@
 import cv2
 import mediapipe as mp
-import numpy as np
+import sys
 import time
+from capture.frame_source import open_source
+from headtracking.kalman_tracker import KalmanTracker
 
 # Initialize Mediapipe Face Detection
 mp_face_detection = mp.solutions.face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.1)
 
-# Video Setup
-cap = cv2.VideoCapture(1, cv2.CAP_DSHOW)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 320)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)
+# Video Setup: camera index, video file, image directory or "synthetic"
+# e.g. python -m headtracking.combination_tracker synthetic
+source_spec = sys.argv[1] if len(sys.argv) > 1 else "1"
+cap = open_source(source_spec, width=320, height=240, api_preference=cv2.CAP_DSHOW)
 
 # FPS Control
 TARGET_FPS = 20
 FRAME_TIME = 1.0 / TARGET_FPS
 
-# Kalman Filter Setup (4 state variables: x, y, dx, dy)
-kalman = cv2.KalmanFilter(4, 2)
-kalman.transitionMatrix = np.array([
-    [1, 0, 1, 0],
-    [0, 1, 0, 1],
-    [0, 0, 1, 0],
-    [0, 0, 0, 1],
-], dtype=np.float32)
-
-kalman.measurementMatrix = np.array([
-    [1, 0, 0, 0],
-    [0, 1, 0, 0],
-], dtype=np.float32)
-
-kalman.processNoiseCov = np.diag([0.03, 0.03, 0.1, 0.1]).astype(np.float32)
-kalman.measurementNoiseCov = np.eye(2, dtype=np.float32) * 0.1
-kalman.errorCovPost = np.eye(4, dtype=np.float32) * 1
+# Kalman Filter Setup (4 state variables: x, y, dx, dy), stepped by real frame time
+kalman = KalmanTracker()
 
 initialized = False
 prev_time = time.time()
@@ -57,24 +44,25 @@ while True:
         if detection_results.detections:
             detection = detection_results.detections[0]  # Take the first detected face
             bbox = detection.location_data.relative_bounding_box
-            x, y, w, h = int(bbox.xmin * 320), int(bbox.ymin * 240), int(bbox.width * 320), int(bbox.height * 240)
+            ih, iw, _ = frame.shape
+            x, y, w, h = int(bbox.xmin * iw), int(bbox.ymin * ih), int(bbox.width * iw), int(bbox.height * ih)
             forehead_x = x + w // 2
             forehead_y = y + int(h * 0.2)
 
             cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
 
+    if initialized:
+        kalman.predict(start_time)
+
     if forehead_x is not None and forehead_y is not None:
         if not initialized:
-            kalman.statePost = np.array([forehead_x, forehead_y, 0, 0], dtype=np.float32)
+            kalman.initialize(forehead_x, forehead_y, start_time)
             initialized = True
-
-        measurement = np.array([[np.float32(forehead_x)], [np.float32(forehead_y)]])
-        kalman.correct(measurement)
+        else:
+            kalman.correct(forehead_x, forehead_y)
 
     if initialized:
-        predicted = kalman.predict()
-        predicted_x = int(predicted[0, 0])
-        predicted_y = int(predicted[1, 0])
+        predicted_x, predicted_y = (int(v) for v in kalman.position())
 
         cv2.circle(frame, (predicted_x, predicted_y), 4, (0, 0, 255), -1)
 
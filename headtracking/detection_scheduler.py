@@ -0,0 +1,93 @@
+import time
+
+import numpy as np
+
+from capture.scene_change import FrameThumbnail
+
+class DetectionScheduler:
+    def __init__(self, frame_budget=1.0 / 20, min_interval=1, max_interval=10,
+                 innovation_threshold=6.0, uncertainty_threshold=4.0, motion_threshold=0.5,
+                 pixel_change_threshold=12):
+        """
+        Decides per frame whether the expensive face model should run.
+        Between detections the Kalman filter coasts on its prediction.
+        :param frame_budget: Seconds available per frame (1 / target FPS).
+        :param min_interval: Minimum frames between detections.
+        :param max_interval: Maximum frames between detections, even for a still target.
+        :param innovation_threshold: Pixel error between the last measurement and the
+            prediction above which the target counts as manoeuvring.
+        :param uncertainty_threshold: Kalman position standard deviation (pixels) above
+            which the estimate needs a fresh measurement.
+        :param motion_threshold: Percentage of thumbnail pixels that must change for
+            the scene to count as moving.
+        :param pixel_change_threshold: Grey level difference for a thumbnail pixel to
+            count as changed; filters out sensor noise.
+        """
+        self.frame_budget = frame_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.innovation_threshold = innovation_threshold
+        self.uncertainty_threshold = uncertainty_threshold
+        self.motion_threshold = motion_threshold
+
+        self.frames_since_detection = max_interval
+        self.detection_cost = 0.0  # Running average of seconds per detection
+        self.detections = 0
+        self.skipped = 0
+
+        # Thumbnails for the motion measure
+        self.thumb = FrameThumbnail(pixel_change_threshold=pixel_change_threshold)
+        self.prev_thumb = np.zeros_like(self.thumb.image)
+        self.has_prev_thumb = False
+
+    def motion_energy(self, frame):
+        """Percentage of thumbnail pixels that changed since the previous frame."""
+        self.thumb.update(frame)
+        if not self.has_prev_thumb:
+            energy = 100.0
+            self.has_prev_thumb = True
+        else:
+            energy = self.thumb.changed_percent(self.prev_thumb)
+        np.copyto(self.prev_thumb, self.thumb.image)
+        return energy
+
+    def should_detect(self, frame_start, tracking, innovation, uncertainty, motion):
+        """
+        :param frame_start: time.time() at which the current frame started processing.
+        :param tracking: Whether the filter currently has a target.
+        :param innovation: Pixel distance between the last measurement and its prediction.
+        :param uncertainty: Predicted position standard deviation in pixels.
+        :param motion: Motion energy of the current frame.
+        """
+        self.frames_since_detection += 1
+        if self.frames_since_detection < self.min_interval:
+            return self._skip()
+        if self.frames_since_detection >= self.max_interval:
+            return True
+
+        urgent = (not tracking
+                  or innovation > self.innovation_threshold
+                  or uncertainty > self.uncertainty_threshold
+                  or motion > self.motion_threshold)
+        if not urgent:
+            return self._skip()
+
+        # Leave the model for a later frame if it would blow this frame's budget,
+        # but never put it off for more than a couple of frames
+        time_left = self.frame_budget - (time.time() - frame_start)
+        if time_left < self.detection_cost and self.frames_since_detection <= 2 * self.min_interval:
+            return self._skip()
+        return True
+
+    def record_detection(self, duration):
+        """Call after every model run with how long it took."""
+        self.frames_since_detection = 0
+        self.detections += 1
+        if self.detection_cost == 0.0:
+            self.detection_cost = duration
+        else:
+            self.detection_cost = 0.8 * self.detection_cost + 0.2 * duration
+
+    def _skip(self):
+        self.skipped += 1
+        return False
@@ -1,5 +1,7 @@
 import cv2
 import dlib
+import sys
+from capture.frame_source import open_source
 
 # Load face detector (HOG or CNN)
 detector = dlib.get_frontal_face_detector()
@@ -8,7 +10,10 @@ detector = dlib.get_frontal_face_detector()
 predictor_path = "shape_predictor_68_face_landmarks.dat"
 predictor = dlib.shape_predictor(predictor_path)
 
-cap = cv2.VideoCapture(1, cv2.CAP_DSHOW)
+# Camera index, video file, image directory or "synthetic"
+# e.g. python -m headtracking.dlib_tracker synthetic
+source_spec = sys.argv[1] if len(sys.argv) > 1 else "1"
+cap = open_source(source_spec, api_preference=cv2.CAP_DSHOW)
 
 
 while True:
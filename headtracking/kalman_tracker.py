@@ -0,0 +1,119 @@
+import math
+
+import numpy as np
+
+
+class KalmanTracker:
+    def __init__(self, measurement_noise=2.0, acceleration_noise=200.0, initial_velocity_std=200.0,
+                 max_dt=0.5):
+        """
+        Constant velocity Kalman filter for a 2D point, state [x, y, vx, vy].
+        The transition is rebuilt from the real time between frames, so the filter
+        stays consistent at a variable frame rate. Velocities are in pixels/second.
+        :param measurement_noise: Standard deviation of a measurement in pixels.
+        :param acceleration_noise: Standard deviation of the unmodelled acceleration in pixels/s^2.
+            Higher follows sudden moves faster but lets landmark jitter into the velocity,
+            which feeds the aim point and the turret feed-forward.
+        :param initial_velocity_std: Velocity uncertainty when a track starts, in pixels/s.
+        :param max_dt: Longest step the filter will take in one predict, in seconds.
+        """
+        self.measurement_noise = measurement_noise
+        self.acceleration_noise = acceleration_noise
+        self.initial_velocity_std = initial_velocity_std
+        self.max_dt = max_dt
+
+        # Filter state and preallocated work buffers, reused every frame
+        self.x = np.zeros(4)
+        self.P = np.eye(4)
+        self.F = np.eye(4)
+        self.Q = np.zeros((4, 4))
+        self.R = np.eye(2) * measurement_noise ** 2
+        self.FP = np.zeros((4, 4))
+        self.K = np.zeros((4, 2))
+        self.S_inv = np.zeros((2, 2))
+        self.KP = np.zeros((4, 4))
+        self.x_tmp = np.zeros(4)
+        self.residual = np.zeros(2)
+
+        self.timestamp = None
+        self.initialized = False
+        self.innovation = 0.0
+
+    def initialize(self, x, y, timestamp):
+        """Starts a new track at a measured position with unknown velocity."""
+        self.x[:] = (x, y, 0.0, 0.0)
+        self.P[:] = 0.0
+        self.P[0, 0] = self.P[1, 1] = self.measurement_noise ** 2
+        self.P[2, 2] = self.P[3, 3] = self.initial_velocity_std ** 2
+        self.timestamp = timestamp
+        self.initialized = True
+        self.innovation = 0.0
+
+    def predict(self, timestamp):
+        """
+        Advances the state to timestamp (seconds, same clock as initialize).
+        :return: Predicted state [x, y, vx, vy]. The array is reused, copy it to keep it.
+        """
+        dt = min(max(timestamp - self.timestamp, 0.0), self.max_dt)
+        self.timestamp = timestamp
+        if dt == 0.0:
+            return self.x
+
+        self.F[0, 2] = self.F[1, 3] = dt
+
+        # Discrete white-noise acceleration model
+        q = self.acceleration_noise ** 2
+        self.Q[0, 0] = self.Q[1, 1] = q * dt ** 4 / 4
+        self.Q[0, 2] = self.Q[2, 0] = self.Q[1, 3] = self.Q[3, 1] = q * dt ** 3 / 2
+        self.Q[2, 2] = self.Q[3, 3] = q * dt ** 2
+
+        np.dot(self.F, self.x, out=self.x_tmp)
+        self.x[:] = self.x_tmp
+        np.dot(self.F, self.P, out=self.FP)
+        np.dot(self.FP, self.F.T, out=self.P)
+        self.P += self.Q
+        return self.x
+
+    def correct(self, x, y):
+        """
+        Folds a position measurement into the state.
+        :return: Innovation, the distance in pixels between measurement and prediction.
+        """
+        self.residual[0] = x - self.x[0]
+        self.residual[1] = y - self.x[1]
+        self.innovation = math.hypot(self.residual[0], self.residual[1])
+
+        # The measurement picks out the position, so S = P[:2, :2] + R and K = P[:, :2] S^-1
+        a = self.P[0, 0] + self.R[0, 0]
+        b = self.P[0, 1] + self.R[0, 1]
+        c = self.P[1, 0] + self.R[1, 0]
+        d = self.P[1, 1] + self.R[1, 1]
+        det = a * d - b * c
+        self.S_inv[0, 0] = d / det
+        self.S_inv[0, 1] = -b / det
+        self.S_inv[1, 0] = -c / det
+        self.S_inv[1, 1] = a / det
+        np.dot(self.P[:, :2], self.S_inv, out=self.K)
+
+        np.dot(self.K, self.residual, out=self.x_tmp)
+        self.x += self.x_tmp
+        np.dot(self.K, self.P[:2, :], out=self.KP)
+        self.P -= self.KP
+        return self.innovation
+
+    def predict_ahead(self, latency):
+        """
+        Position the target will be at after latency seconds, without changing the state.
+        Used to aim where the head will be once the command has taken effect.
+        """
+        return self.x[0] + self.x[2] * latency, self.x[1] + self.x[3] * latency
+
+    def position(self):
+        return self.x[0], self.x[1]
+
+    def velocity(self):
+        return self.x[2], self.x[3]
+
+    def position_std(self):
+        """Standard deviation of the position estimate along its least certain axis, in pixels."""
+        return math.sqrt(max(self.P[0, 0], self.P[1, 1]))
@@ -2,54 +2,74 @@ import cv2
 import mediapipe as mp
 import numpy as np
 import time
-import math
+from capture.frame_grabber import FrameGrabber
+from capture.frame_source import CameraSource
+from capture.scene_change import SceneChangeDetector
+from headtracking.detection_scheduler import DetectionScheduler
+from headtracking.kalman_tracker import KalmanTracker
+from headtracking.track_bank import TrackBank
+from headtracking import roi
+from servo.visual_servo import TrackingError
 
 class ForeheadTracking:
-    def __init__(self):
+    def __init__(self, source=None, roi_mode=False, actuation_latency=0.15, max_num_faces=1, draw_overlays=True,
+                 skip_static=True):
+        """
+        :param source: Frame source to track on; defaults to the first camera.
+        :param roi_mode: Run FaceMesh only on a crop around the predicted head
+            position, falling back to the full frame when the target is lost.
+            Only used when tracking a single face. Off by default: FaceMesh scales its
+            input to a fixed size anyway, so at camera resolutions it is not faster.
+        :param actuation_latency: Seconds between a command leaving the tracker and
+            the turret reaching it. Added to the measured pipeline latency to aim
+            where the head will be rather than where it was.
+        :param max_num_faces: Faces to detect per frame. With more than one, every
+            face gets a persistent track and the turret stays locked on one of them.
+        :param draw_overlays: Draw the tracking overlays onto the returned frame. When
+            False the frame is left untouched and viewers draw them from last_metadata.
+        :param skip_static: Skip frames in which nothing changed since the last
+            processed one; track_forehead returns (None, None) for them.
+        """
         # Initialize Mediapipe Face Mesh
         self.mp_face_mesh = mp.solutions.face_mesh
         self.face_mesh = self.mp_face_mesh.FaceMesh(
             static_image_mode=False,
-            max_num_faces=1,
+            max_num_faces=max_num_faces,
             min_detection_confidence=0.1,
             min_tracking_confidence=0.1,
         )
+        # Crops are searched by their own instance: a tracking FaceMesh fed crops and
+        # full frames in turn loses its state and finds nothing in either
+        self.roi_face_mesh = self.mp_face_mesh.FaceMesh(
+            static_image_mode=False,
+            max_num_faces=1,
+            min_detection_confidence=0.1,
+        ) if roi_mode and max_num_faces == 1 else None
 
-        # Video Setup
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 320)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)
+        # Video Setup (defaults to the first camera at 320x240)
+        if source is None:
+            source = CameraSource(0, width=320, height=240)
+        self.cap = source
 
         # Determine center point
         self.frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         self.frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        # Live cameras are read on a background thread so track_forehead never waits
+        # on them; replay sources are read in step so every frame gets processed
+        self.grabber = FrameGrabber(self.cap).start()
+        self.last_seq = -1
+        self.last_capture_time = None
         self.center = (self.frame_width // 2, self.frame_height // 2)
         self.fire_threshold = 35 #pixel radius from center to fire.
-        self.xy_pixel_threshold = 7 #prevents tiny microadjustments when centered.
         # FPS Control
         self.TARGET_FPS = 20
         self.FRAME_TIME = 1.0 / self.TARGET_FPS
 
-        # Kalman Filter Setup (4 state variables: x, y, dx, dy)
-        self.kalman = cv2.KalmanFilter(4, 2)
-
-        # State transition matrix for constant velocity model
-        self.kalman.transitionMatrix = np.array([
-            [1, 0, 1, 0],
-            [0, 1, 0, 1],
-            [0, 0, 1, 0],
-            [0, 0, 0, 1],
-        ], dtype=np.float32)
-
-        self.kalman.measurementMatrix = np.array([
-            [1, 0, 0, 0],
-            [0, 1, 0, 0],
-        ], dtype=np.float32)
-
-        # Tune noise values
-        self.kalman.processNoiseCov = np.diag([0.03, 0.03, 0.1, 0.1]).astype(np.float32)
-        self.kalman.measurementNoiseCov = np.eye(2, dtype=np.float32) * 0.1
-        self.kalman.errorCovPost = np.eye(4, dtype=np.float32) * 1
+        # Kalman Filter Setup (4 state variables: x, y, dx, dy), stepped by real frame time
+        self.kalman = KalmanTracker()
+        self.actuation_latency = actuation_latency
+        self.pipeline_latency = 0.0  # Running average of capture-to-command time
 
         self.initialized = False
         self.prev_time = time.time()
@@ -57,95 +77,191 @@ class ForeheadTracking:
         self.rgb_frame = None
         self.last_results = None
 
-    def calculate_vertical_degree_offset(self, predicted_y, center_y, frame_height=480, half_vertical_fov=22.78845):
-        half_vertical_fov_radians = math.radians(half_vertical_fov)
-        z = ((frame_height/2) / math.tan(half_vertical_fov_radians)) # "distance from projection plane"
-
-        res = math.degrees(math.atan((abs(predicted_y - center_y)) / z))
-
-        #if (predicted_y - center_y > 0):
-        #    res = -res
-
-        return round(res)
-
-    def calculate_horizontal_degree_offset(self, predicted_x, center_x, frame_width=640, half_horizontal_fov=29.25605):
-        half_horziontal_fov_radians = math.radians(half_horizontal_fov)
-        z = ((frame_width/2) / math.tan(half_horziontal_fov_radians)) # "distance from projection plane"
-
-        res = math.degrees(math.atan((abs(predicted_x - center_x)) / z))
-
-        #if (predicted_x - center_x < 0):
-        #    res = -res
+        # Decides each frame whether FaceMesh needs to run
+        self.scheduler = DetectionScheduler(frame_budget=self.FRAME_TIME)
+        self.target_visible = False
+        self.missed_detections = 0
+        self.max_missed_detections = 3  # Misses before the old track is discarded
+        self.last_innovation = 0.0
+
+        # Region-of-interest search
+        self.roi_mode = roi_mode and max_num_faces == 1
+        self.face_extent = None  # Face size in pixels from the last detection
+        self.last_roi = None
+        self.roi_attempts = 0
+        self.roi_hits = 0
+
+        # Multi-face tracks; the Kalman filter above follows the locked one
+        self.tracks = TrackBank() if max_num_faces > 1 else None
+        self.target_id = None
+
+        # Overlay drawing, or a per-frame description of it for client-side rendering
+        self.draw_overlays = draw_overlays
+        self.last_metadata = None
+
+        # Static scene detection
+        self.scene = SceneChangeDetector() if skip_static else None
+        self.scene_static = False  # Whether the last track_forehead call skipped a static frame
+
+    def detect_forehead(self, frame, predicted, timestamp):
+        """
+        Runs FaceMesh and returns the forehead position in frame pixels, or None.
+        In ROI mode only a crop around the predicted position is searched; if the
+        face is not in it, or there is no usable prediction, the whole frame is.
+        With several faces, the forehead of the locked track is returned.
+        """
+        ih, iw, _ = frame.shape
+        region = None
+        if (self.roi_mode and predicted is not None and self.target_visible
+                and self.face_extent is not None):
+            region = roi.search_region(predicted[0], predicted[1], self.face_extent,
+                                       self.kalman.position_std(), iw, ih)
+
+        if region is not None:
+            x0, y0, x1, y1 = region
+            self.rgb_frame = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+            self.last_results = self.roi_face_mesh.process(self.rgb_frame)
+            self.roi_attempts += 1
+            if self.last_results.multi_face_landmarks:
+                self.roi_hits += 1
+            else:
+                region = None  # Lost inside the crop, search everywhere
 
-        #print(f"Predicted x: {predicted_x}, Center x: {center_x}, Offset: {round(res)}")
-        return round(res)
+        if region is None:
+            region = (0, 0, iw, ih)
+            self.rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            self.last_results = self.face_mesh.process(self.rgb_frame)
+            if not self.last_results.multi_face_landmarks:
+                self.last_roi = None
+                if self.tracks is not None:
+                    self.tracks.update([], timestamp)
+                return None
+
+        self.last_roi = region
+        if self.tracks is not None:
+            return self.select_locked_forehead(frame, timestamp)
+
+        face_landmarks = self.last_results.multi_face_landmarks[0]
+        self.face_extent = roi.face_extent(face_landmarks, region[2] - region[0], region[3] - region[1])
+        return roi.landmark_to_frame(face_landmarks.landmark[151], region)
+
+    def select_locked_forehead(self, frame, timestamp):
+        """Updates the face tracks with every detected forehead and returns the locked one's."""
+        ih, iw, _ = frame.shape
+        faces = self.last_results.multi_face_landmarks
+        foreheads = [(face.landmark[151].x * iw, face.landmark[151].y * ih) for face in faces]
+        track_ids = self.tracks.update(foreheads, timestamp)
+        target_id = self.tracks.select_target(self.center)
+
+        if target_id != self.target_id:
+            # New target: restart the aiming filter instead of blending two heads
+            self.target_id = target_id
+            self.missed_detections = self.max_missed_detections
+        matches = np.flatnonzero(track_ids == target_id) if target_id is not None else []
+        if not len(matches):
+            return None  # Locked target not seen this frame
+
+        face_landmarks = faces[matches[0]]
+        self.face_extent = roi.face_extent(face_landmarks, iw, ih)
+        return roi.landmark_to_frame(face_landmarks.landmark[151], (0, 0, iw, ih))
 
     def track_forehead(self):
+        """
+        Tracks the head on the newest frame.
+        :return: (frame, TrackingError or None). The frame is None if there was no new
+            frame, or if the new one was skipped as static; scene_static tells them apart.
+        """
         start_time = time.time()
-        command = ""
-        ret, frame = self.cap.read()
-        if not ret:
-            return None
+        tracking_error = None
+        latest = self.grabber.read_latest(newer_than=self.last_seq)
+        if latest is None:
+            self.scene_static = False
+            return None, None  # No new frame since the last call
+        self.last_seq = latest.seq
+        self.last_capture_time = latest.timestamp
+        frame = latest.image
+
+        # Nothing has moved since the last processed frame: skip the model and the encode
+        self.scene_static = self.scene is not None and not self.scene.changed(frame, latest.timestamp)
+        if self.scene_static:
+            return None, None
 
         self.frame_count += 1
 
-        if self.frame_count % 3 == 0:
-            self.rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            self.last_results = self.face_mesh.process(self.rgb_frame)
-
-        if self.last_results and self.last_results.multi_face_landmarks:
-            for face_landmarks in self.last_results.multi_face_landmarks:
-                ih, iw, _ = frame.shape
-                forehead_landmark = face_landmarks.landmark[151]
-                forehead_x, forehead_y = int(forehead_landmark.x * iw), int(forehead_landmark.y * ih)
-
-                # Initialize Kalman state on first detection
-                if not self.initialized:
-                    self.kalman.statePost = np.array([forehead_x, forehead_y, 0, 0], dtype=np.float32)
+        # Advance the filter once per frame; measurements only come from fresh detections
+        predicted = None
+        uncertainty = 0.0
+        if self.initialized:
+            predicted = self.kalman.predict(latest.timestamp)
+            uncertainty = self.kalman.position_std()
+
+        motion = self.scheduler.motion_energy(frame)
+        detect_time = None
+        if self.scheduler.should_detect(start_time, self.target_visible, self.last_innovation, uncertainty, motion):
+            detect_start = time.time()
+            forehead = self.detect_forehead(frame, predicted, latest.timestamp)
+            detect_time = time.time() - detect_start
+            self.scheduler.record_detection(detect_time)
+
+            if forehead is not None:
+                forehead_x, forehead_y = forehead
+
+                # Initialize Kalman state on first detection, or after the target was lost
+                if not self.initialized or self.missed_detections >= self.max_missed_detections:
+                    self.kalman.initialize(forehead_x, forehead_y, latest.timestamp)
                     self.initialized = True
-
-                # Feed new measurement into Kalman
-                measurement = np.array([[np.float32(forehead_x)], [np.float32(forehead_y)]])
-                self.kalman.correct(measurement)
-
-        if self.initialized and self.last_results and self.last_results.multi_face_landmarks:
-            # Predict position using Kalman filter
-            predicted = self.kalman.predict()
-            predicted_x = int(predicted[0])
-            predicted_y = int(predicted[1])
-
-            # Draw red dot for predicted forehead position
-            cv2.circle(frame, (predicted_x, predicted_y), 4, (0, 0, 255), -1)
-
-            #draw crosshair
-            cv2.circle(frame, self.center, self.fire_threshold, (255, 0, 0), 2)
+                    self.last_innovation = 0.0
+                else:
+                    # Feed new measurement into Kalman
+                    self.last_innovation = self.kalman.correct(forehead_x, forehead_y)
+                self.target_visible = True
+                self.missed_detections = 0
+            else:
+                self.target_visible = False
+                self.missed_detections += 1
+
+        estimate = aim = None
+        if self.initialized and self.target_visible:
+            # Aim where the head will be once this frame's command has been carried out
+            # (the state is at the capture time, the command leaves pipeline_latency later)
+            latency = self.pipeline_latency + self.actuation_latency
+            aim_x, aim_y = self.kalman.predict_ahead(latency)
+            predicted_x = int(aim_x)
+            predicted_y = int(aim_y)
+
+            estimate_x, estimate_y = self.kalman.position()
+            estimate = (int(estimate_x), int(estimate_y))
+            aim = (predicted_x, predicted_y)
+            if self.draw_overlays:
+                # Draw red dot for the current forehead estimate and a yellow one for the aim point
+                cv2.circle(frame, estimate, 4, (0, 0, 255), -1)
+                cv2.circle(frame, aim, 3, (0, 255, 255), -1)
+
+                #draw crosshair
+                cv2.circle(frame, self.center, self.fire_threshold, (255, 0, 0), 2)
             center_x, center_y = self.center
             distance = np.sqrt((predicted_x - center_x) ** 2 + (predicted_y - center_y) ** 2)
 
-            if distance < self.fire_threshold:
-                command += "Fire"
-            else:
-                if abs(predicted_x - center_x) < self.xy_pixel_threshold:
-                    command += "XGood,0,"
-                elif predicted_x < center_x:
-                    command += "Left," + str(self.calculate_horizontal_degree_offset(predicted_x, center_x)) + ","
-                else:
-                    command += "Right," + str(self.calculate_horizontal_degree_offset(predicted_x, center_x)) + ","
-
-                if abs(predicted_y - center_y) < self.xy_pixel_threshold:
-                    command += "YGood,0"
-                elif predicted_y < center_y:
-                    command += "Up," + str(self.calculate_vertical_degree_offset(predicted_y, center_y))
-                else:
-                    command += "Down," + str(self.calculate_vertical_degree_offset(predicted_y, center_y))
-            cv2.putText(frame, command, (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            # Numbers for the turret controller: where the head is at capture time and how fast it moves.
+            # The controller compensates latency itself, so it gets the estimate rather than the aim point
+            on_target = bool(distance < self.fire_threshold)
+            tracking_error = TrackingError(latest.timestamp, (estimate_x - center_x, estimate_y - center_y),
+                                           tuple(self.kalman.velocity()), (self.frame_width, self.frame_height),
+                                           on_target)
+            if self.draw_overlays:
+                label = "Fire" if on_target else f"dx {estimate_x - center_x:+.0f} dy {estimate_y - center_y:+.0f}"
+                cv2.putText(frame, label, (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
 
 
         # FPS Display
         current_time = time.time()
+        self.pipeline_latency = 0.9 * self.pipeline_latency + 0.1 * (current_time - latest.timestamp)
         fps = 1.0 / (current_time - self.prev_time)
         self.prev_time = current_time
-        cv2.putText(frame, f"FPS: {fps:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        if self.draw_overlays:
+            cv2.putText(frame, f"FPS: {fps:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        self.last_metadata = self.frame_metadata(latest, estimate, aim, tracking_error, fps, detect_time,
+                                                 current_time - start_time)
 
 
         #cv2.imshow("Kalman Filter - Constant Velocity (Forehead Tracking)", frame)
@@ -158,8 +274,40 @@ class ForeheadTracking:
 
 
         # Return the processed frame
-        return frame, command
+        return frame, tracking_error
+
+    def frame_metadata(self, latest, estimate, aim, tracking_error, fps, detect_time, track_time):
+        """
+        Everything the overlays show for one frame, as JSON-friendly types, so a
+        viewer can draw them itself on top of the untouched frame.
+        """
+        tracks = []
+        if self.tracks is not None:
+            for slot in self.tracks.confirmed().tolist():
+                track_id = int(self.tracks.ids[slot])
+                x, y = self.tracks.X[slot, :2].tolist()
+                tracks.append({"id": track_id, "x": round(x, 1), "y": round(y, 1),
+                               "locked": track_id == self.target_id})
+        return {
+            "seq": latest.seq,
+            "timestamp": latest.timestamp,
+            "size": [self.frame_width, self.frame_height],
+            "center": list(self.center),
+            "fire_radius": self.fire_threshold,
+            "estimate": list(estimate) if estimate is not None else None,
+            "aim": list(aim) if aim is not None else None,
+            "roi": list(self.last_roi) if self.last_roi is not None else None,
+            "tracks": tracks,
+            "error": [round(v, 1) for v in tracking_error.error] if tracking_error is not None else None,
+            "on_target": tracking_error.on_target if tracking_error is not None else False,
+            "fps": round(fps, 2),
+            "timings": {
+                "detect_ms": round(detect_time * 1000.0, 2) if detect_time is not None else None,
+                "track_ms": round(track_time * 1000.0, 2),
+                "latency_ms": round(self.pipeline_latency * 1000.0, 2),
+            },
+        }
 
     def deconstruct(self):
-        self.cap.release()
+        self.grabber.stop()
         cv2.destroyAllWindows()
@@ -1,7 +1,9 @@
 import cv2
 import mediapipe as mp
-import numpy as np
+import sys
 import time
+from capture.frame_source import open_source
+from headtracking.kalman_tracker import KalmanTracker
 
 # Initialize Mediapipe Face Mesh
 mp_face_mesh = mp.solutions.face_mesh
@@ -12,10 +14,10 @@ face_mesh = mp_face_mesh.FaceMesh(
     min_tracking_confidence=0.1,
 )
 
-# Video Setup
-cap = cv2.VideoCapture(1, cv2.CAP_DSHOW)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 320)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)
+# Video Setup: camera index, video file, image directory or "synthetic"
+# e.g. python -m headtracking.mediapipe_tracker synthetic
+source_spec = sys.argv[1] if len(sys.argv) > 1 else "1"
+cap = open_source(source_spec, width=320, height=240, api_preference=cv2.CAP_DSHOW)
 
 # FPS Control
 TARGET_FPS = 20
@@ -24,26 +26,8 @@ FRAME_TIME = 1.0 / TARGET_FPS
 frame_count = 0
 last_results = None
 
-# Kalman Filter Setup (4 state variables: x, y, dx, dy)
-kalman = cv2.KalmanFilter(4, 2)
-
-# State transition matrix for constant velocity model
-kalman.transitionMatrix = np.array([
-    [1, 0, 1, 0],
-    [0, 1, 0, 1],
-    [0, 0, 1, 0],
-    [0, 0, 0, 1],
-], dtype=np.float32)
-
-kalman.measurementMatrix = np.array([
-    [1, 0, 0, 0],
-    [0, 1, 0, 0],
-], dtype=np.float32)
-
-# Tune noise values
-kalman.processNoiseCov = np.diag([0.03, 0.03, 0.1, 0.1]).astype(np.float32)
-kalman.measurementNoiseCov = np.eye(2, dtype=np.float32) * 0.1
-kalman.errorCovPost = np.eye(4, dtype=np.float32) * 1
+# Kalman Filter Setup (4 state variables: x, y, dx, dy), stepped by real frame time
+kalman = KalmanTracker()
 
 initialized = False
 prev_time = time.time()
@@ -54,14 +38,22 @@ while True:
     ret, frame = cap.read()
     if not ret:
         break
+    frame_time = time.time()
 
     frame_count += 1
 
+    if initialized:
+        # Predict position using Kalman filter
+        kalman.predict(frame_time)
+
+    fresh_results = False
     if frame_count % 3 == 0:
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         last_results = face_mesh.process(rgb_frame)
+        fresh_results = True
 
-    if last_results and last_results.multi_face_landmarks:
+    # Only measurements from this frame go into the filter
+    if fresh_results and last_results.multi_face_landmarks:
         for face_landmarks in last_results.multi_face_landmarks:
             ih, iw, _ = frame.shape
             forehead_landmark = face_landmarks.landmark[151]
@@ -69,18 +61,14 @@ while True:
 
             # Initialize Kalman state on first detection
             if not initialized:
-                kalman.statePost = np.array([forehead_x, forehead_y, 0, 0], dtype=np.float32)
+                kalman.initialize(forehead_x, forehead_y, frame_time)
                 initialized = True
-
-            # Feed new measurement into Kalman
-            measurement = np.array([[np.float32(forehead_x)], [np.float32(forehead_y)]])
-            kalman.correct(measurement)
+            else:
+                # Feed new measurement into Kalman
+                kalman.correct(forehead_x, forehead_y)
 
     if initialized:
-        # Predict position using Kalman filter
-        predicted = kalman.predict()
-        predicted_x = int(predicted[0])
-        predicted_y = int(predicted[1])
+        predicted_x, predicted_y = (int(v) for v in kalman.position())
 
         # Draw red dot for predicted forehead position
         cv2.circle(frame, (predicted_x, predicted_y), 4, (0, 0, 255), -1)
@@ -0,0 +1,45 @@
+# FaceMesh landmarks at the top, bottom and sides of the face, used to measure its size
+FACE_EXTENT_LANDMARKS = (10, 152, 234, 454)
+
+
+def face_extent(face_landmarks, roi_width, roi_height):
+    """
+    Approximate face size in pixels: the larger of its width and height.
+    :param face_landmarks: FaceMesh landmarks, normalised to the searched image.
+    :param roi_width: Width of the image the landmarks are normalised to.
+    :param roi_height: Height of the image the landmarks are normalised to.
+    """
+    points = [face_landmarks.landmark[i] for i in FACE_EXTENT_LANDMARKS]
+    xs = [p.x * roi_width for p in points]
+    ys = [p.y * roi_height for p in points]
+    return max(max(xs) - min(xs), max(ys) - min(ys))
+
+
+def search_region(center_x, center_y, extent, position_std, frame_width, frame_height,
+                  margin=1.6, sigmas=3.0, min_size=64, max_fraction=0.8):
+    """
+    Square region around the predicted forehead that should contain the whole face.
+    The half-size is the last face size scaled by margin plus a few standard
+    deviations of the Kalman position estimate.
+    :return: (x0, y0, x1, y1) in frame pixels, or None if the region would cover most
+        of the frame anyway and a full-frame search is cheaper.
+    """
+    half = max(min_size / 2, extent * margin / 2 + sigmas * position_std)
+    if 2 * half >= max_fraction * min(frame_width, frame_height):
+        return None
+
+    # The forehead point sits in the upper part of the face, so shift the box down
+    center_y += extent * 0.3
+    x0 = int(max(0, center_x - half))
+    y0 = int(max(0, center_y - half))
+    x1 = int(min(frame_width, center_x + half))
+    y1 = int(min(frame_height, center_y + half))
+    if x1 - x0 < min_size / 2 or y1 - y0 < min_size / 2:
+        return None  # Prediction has left the frame
+    return x0, y0, x1, y1
+
+
+def landmark_to_frame(landmark, region):
+    """Maps a landmark normalised to region back to full-frame pixel coordinates."""
+    x0, y0, x1, y1 = region
+    return int(x0 + landmark.x * (x1 - x0)), int(y0 + landmark.y * (y1 - y0))
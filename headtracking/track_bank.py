@@ -0,0 +1,181 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+# 99% gate for a 2-dof chi-squared distance
+GATE_CHI2 = 9.21
+# Cost given to pairs outside the gate so the assignment never picks them
+NO_MATCH = 1e6
+
+
+class TrackBank:
+    def __init__(self, max_tracks=32, measurement_noise=4.0, acceleration_noise=800.0,
+                 initial_velocity_std=200.0, min_hits=2, max_misses=8, gate=GATE_CHI2, max_dt=0.5):
+        """
+        Constant velocity Kalman filters for many targets at once, with persistent IDs.
+        All track states live in fixed-size numpy arrays so predict and update run
+        as batched array operations instead of a Python loop per track.
+        :param max_tracks: Capacity of the bank.
+        :param measurement_noise: Standard deviation of a detection position in pixels.
+        :param acceleration_noise: Standard deviation of the unmodelled acceleration in pixels/s^2.
+            Deliberately loose: it sizes the association gate, and a tighter value loses
+            heads that turn quickly and gives them new IDs. Only positions are read from
+            the bank, so the noisier velocity does no harm; aiming uses KalmanTracker.
+        :param initial_velocity_std: Velocity uncertainty of a new track in pixels/s.
+        :param min_hits: Detections needed before a track is confirmed.
+        :param max_misses: Consecutive missed detections before a track is deleted.
+        :param gate: Largest Mahalanobis distance (squared) for a detection to match a track.
+        :param max_dt: Longest step the filters will take in one predict, in seconds.
+        """
+        self.max_tracks = max_tracks
+        self.measurement_noise = measurement_noise
+        self.acceleration_noise = acceleration_noise
+        self.initial_velocity_std = initial_velocity_std
+        self.min_hits = min_hits
+        self.max_misses = max_misses
+        self.gate = gate
+        self.max_dt = max_dt
+
+        self.X = np.zeros((max_tracks, 4))            # x, y, vx, vy
+        self.P = np.tile(np.eye(4), (max_tracks, 1, 1))
+        self.boxes = np.zeros((max_tracks, 4), dtype=int)  # Last matched box, (left, top, right, bottom)
+        self.ids = np.full(max_tracks, -1, dtype=int)
+        self.hits = np.zeros(max_tracks, dtype=int)
+        self.misses = np.zeros(max_tracks, dtype=int)
+        self.active = np.zeros(max_tracks, dtype=bool)
+
+        self.F = np.eye(4)
+        self.Q = np.zeros((4, 4))
+        self.R = np.eye(2) * measurement_noise ** 2
+        self.timestamp = None
+        self.next_id = 0
+        self.locked_id = None
+
+    def predict(self, timestamp):
+        """Advances every active track to timestamp."""
+        if self.timestamp is None:
+            self.timestamp = timestamp
+            return
+        dt = min(max(timestamp - self.timestamp, 0.0), self.max_dt)
+        self.timestamp = timestamp
+        if dt == 0.0 or not self.active.any():
+            return
+
+        self.F[0, 2] = self.F[1, 3] = dt
+        q = self.acceleration_noise ** 2
+        self.Q[0, 0] = self.Q[1, 1] = q * dt ** 4 / 4
+        self.Q[0, 2] = self.Q[2, 0] = self.Q[1, 3] = self.Q[3, 1] = q * dt ** 3 / 2
+        self.Q[2, 2] = self.Q[3, 3] = q * dt ** 2
+
+        # Inactive slots are advanced too; it is cheaper than gathering the active ones
+        self.X[:] = self.X @ self.F.T
+        self.P[:] = self.F @ self.P @ self.F.T + self.Q
+
+    def update(self, detections, timestamp, boxes=None):
+        """
+        Predicts to timestamp, associates detections with tracks, corrects matched
+        tracks, starts tracks for unmatched detections and deletes stale ones.
+        :param detections: (N, 2) array of detected target positions in pixels.
+        :param timestamp: Capture time of the frame in seconds.
+        :param boxes: Optional (N, 4) boxes (left, top, right, bottom) stored with each track.
+        :return: (N,) array with the track ID each detection was assigned to.
+        """
+        self.predict(timestamp)
+        detections = np.asarray(detections, dtype=float).reshape(-1, 2)
+        if boxes is not None:
+            boxes = np.asarray(boxes, dtype=int).reshape(-1, 4)
+        assigned = np.full(len(detections), -1, dtype=int)
+        slots = np.flatnonzero(self.active)
+
+        det_idx = np.zeros(0, dtype=int)
+        slot_idx = np.zeros(0, dtype=int)
+        if len(detections) and len(slots):
+            cost = self._mahalanobis(detections, slots)
+            rows, cols = linear_sum_assignment(cost)
+            inside = cost[rows, cols] <= self.gate
+            det_idx, slot_idx = rows[inside], slots[cols[inside]]
+
+        if len(det_idx):
+            self._correct(slot_idx, detections[det_idx])
+            self.hits[slot_idx] += 1
+            self.misses[slot_idx] = 0
+            assigned[det_idx] = self.ids[slot_idx]
+            if boxes is not None:
+                self.boxes[slot_idx] = boxes[det_idx]
+
+        # Tracks that found no detection this frame
+        missed = np.zeros(self.max_tracks, dtype=bool)
+        missed[slots] = True
+        missed[slot_idx] = False
+        self.misses[missed] += 1
+        self.active[self.misses > self.max_misses] = False
+
+        # New tracks for detections nobody claimed
+        for d in np.flatnonzero(assigned < 0):
+            slot = self._birth(detections[d])
+            if slot is None:
+                break
+            assigned[d] = self.ids[slot]
+            if boxes is not None:
+                self.boxes[slot] = boxes[d]
+
+        if self.locked_id is not None and not (self.active & (self.ids == self.locked_id)).any():
+            self.locked_id = None
+        return assigned
+
+    def _mahalanobis(self, detections, slots):
+        """(N, M) squared Mahalanobis distances between detections and the given tracks."""
+        S = self.P[slots, :2, :2] + self.R
+        S_inv = np.linalg.inv(S)
+        residual = detections[:, None, :] - self.X[None, slots, :2]
+        cost = np.einsum('nmi,mij,nmj->nm', residual, S_inv, residual)
+        cost[cost > self.gate] = NO_MATCH
+        return cost
+
+    def _correct(self, slots, measurements):
+        """Batched Kalman correction of several tracks with one measurement each."""
+        P = self.P[slots]
+        S_inv = np.linalg.inv(P[:, :2, :2] + self.R)
+        K = P[:, :, :2] @ S_inv
+        residual = measurements - self.X[slots, :2]
+        self.X[slots] += (K @ residual[:, :, None])[:, :, 0]
+        self.P[slots] = P - K @ P[:, :2, :]
+
+    def _birth(self, position):
+        free = np.flatnonzero(~self.active)
+        if not len(free):
+            return None
+        slot = free[0]
+        self.X[slot] = (position[0], position[1], 0.0, 0.0)
+        self.P[slot] = np.diag([self.measurement_noise ** 2] * 2 + [self.initial_velocity_std ** 2] * 2)
+        self.ids[slot] = self.next_id
+        self.hits[slot] = 1
+        self.misses[slot] = 0
+        self.active[slot] = True
+        self.next_id += 1
+        return slot
+
+    def confirmed(self):
+        """Slot indices of live tracks with enough hits to be trusted."""
+        return np.flatnonzero(self.active & (self.hits >= self.min_hits))
+
+    def slot_of(self, track_id):
+        slots = np.flatnonzero(self.active & (self.ids == track_id))
+        return slots[0] if len(slots) else None
+
+    def select_target(self, center):
+        """
+        Track the turret should aim at. Stays on the locked track for as long as it
+        lives and only then locks onto the confirmed track nearest to center.
+        :return: Track ID, or None if no confirmed track exists.
+        """
+        if self.locked_id is not None:
+            return self.locked_id
+        confirmed = self.confirmed()
+        if not len(confirmed):
+            return None
+        distance = np.hypot(self.X[confirmed, 0] - center[0], self.X[confirmed, 1] - center[1])
+        self.locked_id = int(self.ids[confirmed[np.argmin(distance)]])
+        return self.locked_id
+
+    def release_lock(self):
+        self.locked_id = None
@@ -0,0 +1,42 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedFrameRing:
+    def __init__(self, num_slots, shape, dtype=np.uint8, name=None):
+        """
+        A fixed number of equally sized numpy arrays backed by one shared memory block.
+        The creating process owns the block; other processes attach with attach().
+        :param num_slots: Number of slots in the ring.
+        :param shape: Shape of a single slot, e.g. (240, 320, 3) for a BGR frame.
+        :param dtype: Element type of a slot.
+        :param name: Name of an existing block to attach to instead of creating one.
+        """
+        self.num_slots = num_slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = num_slots * int(np.prod(self.shape)) * self.dtype.itemsize
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.array = np.ndarray((num_slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def spec(self):
+        """Small picklable description used to attach from another process."""
+        return (self.shm.name, self.num_slots, self.shape, self.dtype.str)
+
+    @classmethod
+    def attach(cls, spec):
+        name, num_slots, shape, dtype = spec
+        return cls(num_slots, shape, np.dtype(dtype), name=name)
+
+    def slot(self, index):
+        """Returns a zero-copy view of one slot."""
+        return self.array[index]
+
+    def close(self):
+        # Drop the numpy view first, the buffer cannot be closed while it is exported
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
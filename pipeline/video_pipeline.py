@@ -0,0 +1,338 @@
+"""
+Runs capture, head tracking and JPEG encoding in separate processes.
+
+Frames travel between stages through shared memory slots and only slot indices
+plus a little metadata go through the queues. Every stage works on the newest
+frame it has been handed and returns older slots unprocessed, so a slow stage
+drops stale frames instead of building a backlog.
+
+    capture --(frame slot)--> inference --(frame slot)--> encode --(jpeg slot)--> server
+"""
+import multiprocessing as mp
+import queue
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from capture.frame_source import FrameSource, open_source
+from capture.scene_change import SceneChangeDetector
+from pipeline.shared_ring import SharedFrameRing
+
+# Result handed to the server for each frame. jpeg is None for frames the encode
+# stage skipped to keep to the stream rate; their tracking error still arrives.
+EncodedFrame = namedtuple("EncodedFrame", ["jpeg", "seq", "timestamp", "error", "timings", "metadata"])
+
+QUEUE_TIMEOUT = 0.1
+
+
+def _put_latest(q, item, release):
+    """
+    Puts item on a bounded queue. If the queue is full the oldest waiting item is
+    evicted and handed to release, so the consumer always finds the newest frames.
+    :return: Number of items dropped (0 or 1).
+    """
+    try:
+        q.put_nowait(item)
+        return 0
+    except queue.Full:
+        pass
+    try:
+        release(q.get_nowait())
+    except queue.Empty:
+        pass
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        release(item)
+    return 1
+
+
+def _get_latest(q, release, stop_event):
+    """
+    Blocks until an item is available and returns the newest one.
+    Older items that were waiting are handed to release so their slots get reused.
+    :return: (item, number of stale items skipped), or (None, 0) once stopped.
+    """
+    item = None
+    while item is None:
+        if stop_event.is_set():
+            return None, 0
+        try:
+            item = q.get(timeout=QUEUE_TIMEOUT)
+        except queue.Empty:
+            continue
+    skipped = 0
+    while True:
+        try:
+            newer = q.get_nowait()
+        except queue.Empty:
+            return item, skipped
+        release(item)
+        item = newer
+        skipped += 1
+
+
+def _capture_stage(source_spec, width, height, replay_rate, loop, ring_spec, free_frames, to_inference, skip_static,
+                   stop_event):
+    source = open_source(source_spec, width, height, rate=replay_rate, loop=loop)
+    ring = SharedFrameRing.attach(ring_spec)
+    # Unchanged frames stop here, so inference and encode sit idle on a static scene
+    scene = SceneChangeDetector() if skip_static else None
+    slot_height, slot_width = ring.shape[:2]
+    release = lambda item: free_frames.put(item[0])
+    seq = 0
+    dropped = 0
+    try:
+        while not stop_event.is_set():
+            ret, frame = source.read()
+            timestamp = time.time()
+            if not ret:
+                if not getattr(source, "live", True):
+                    break  # End of a replayed file
+                time.sleep(0.01)  # Camera hiccup: don't spin on a failing read
+                continue
+            if scene is not None and not scene.changed(frame, timestamp):
+                continue
+            try:
+                slot = free_frames.get_nowait()
+            except queue.Empty:
+                dropped += 1  # Every slot is still in use downstream
+                continue
+
+            if frame.shape[:2] == (slot_height, slot_width):
+                np.copyto(ring.slot(slot), frame)
+            else:
+                cv2.resize(frame, (slot_width, slot_height), dst=ring.slot(slot))
+
+            dropped += _put_latest(to_inference, (slot, seq, timestamp, dropped), release)
+            seq += 1
+    finally:
+        source.release()
+        ring.close()
+
+
+class RingSource(FrameSource):
+    def __init__(self, ring, free_frames, incoming, stop_event):
+        """
+        Frame source that hands out shared memory slots fed by the capture stage.
+        The tracker runs on the slot in place; current holds the metadata of the
+        slot that was handed out last.
+        """
+        self.ring = ring
+        self.free_frames = free_frames
+        self.incoming = incoming
+        self.stop_event = stop_event
+        self.current = None
+        self.skipped = 0
+
+    def read(self):
+        item, skipped = _get_latest(self.incoming, lambda stale: self.free_frames.put(stale[0]), self.stop_event)
+        if item is None:
+            return False, None
+        self.skipped += skipped
+        self.current = item
+        return True, self.ring.slot(item[0])
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.ring.shape[1]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.ring.shape[0]
+        return 0
+
+
+def _inference_stage(ring_spec, free_frames, from_capture, to_encode, draw_overlays, stop_event):
+    # Imported here so only the inference process loads MediaPipe
+    from headtracking.mediapipe_copy import ForeheadTracking
+
+    ring = SharedFrameRing.attach(ring_spec)
+    source = RingSource(ring, free_frames, from_capture, stop_event)
+    # Static frames were already filtered out by the capture stage
+    tracker = ForeheadTracking(source, draw_overlays=draw_overlays, skip_static=False)
+    release = lambda item: free_frames.put(item[0])
+    try:
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            frame, error = tracker.track_forehead()
+            if frame is None:
+                continue
+            slot, seq, timestamp, capture_dropped = source.current
+            timings = {
+                "inference_ms": (time.perf_counter() - start) * 1000.0,
+                "dropped": {"capture": capture_dropped, "inference": source.skipped},
+            }
+            _put_latest(to_encode, (slot, seq, timestamp, error, timings, tracker.last_metadata), release)
+    finally:
+        ring.close()
+
+
+def _encode_stage(ring_spec, jpeg_ring_spec, free_frames, free_jpegs, from_inference, to_server,
+                  jpeg_quality, jpeg_scale, jpeg_interval, stop_event):
+    ring = SharedFrameRing.attach(ring_spec)
+    jpeg_ring = SharedFrameRing.attach(jpeg_ring_spec)
+    release_jpeg = lambda s: s[0] is not None and free_jpegs.put(s[0])
+    resized = None
+    skipped = 0
+    last_encoded = 0.0
+    try:
+        while not stop_event.is_set():
+            item, stale = _get_latest(from_inference, lambda s: free_frames.put(s[0]), stop_event)
+            if item is None:
+                break
+            skipped += stale
+            slot, seq, timestamp, error, timings, metadata = item
+
+            now = time.time()
+            if now - last_encoded < jpeg_interval.value:
+                # Not due for the stream: pass the tracking result on without encoding
+                free_frames.put(slot)
+                timings["encode_ms"] = 0.0
+                timings["dropped"]["encode"] = skipped
+                _put_latest(to_server, (None, 0, seq, timestamp, error, timings, metadata), release_jpeg)
+                continue
+            last_encoded = now
+
+            start = time.perf_counter()
+            frame = ring.slot(slot)
+            scale = jpeg_scale.value
+            if scale < 1.0:
+                size = (max(1, int(ring.shape[1] * scale)), max(1, int(ring.shape[0] * scale)))
+                if resized is None or resized.shape[1::-1] != size:
+                    resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+                frame = cv2.resize(frame, size, dst=resized, interpolation=cv2.INTER_AREA)
+            ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality.value])
+            free_frames.put(slot)
+            if not ok:
+                continue
+            try:
+                jpeg_slot = free_jpegs.get_nowait()
+            except queue.Empty:
+                skipped += 1  # The server has not collected earlier frames yet
+                continue
+            length = len(buffer)
+            jpeg_ring.slot(jpeg_slot)[:length] = buffer.reshape(-1)
+            timings["encode_ms"] = (time.perf_counter() - start) * 1000.0
+            timings["dropped"]["encode"] = skipped
+            _put_latest(to_server, (jpeg_slot, length, seq, timestamp, error, timings, metadata), release_jpeg)
+    finally:
+        ring.close()
+        jpeg_ring.close()
+
+
+class VideoPipeline:
+    def __init__(self, source_spec="0", width=320, height=240, frame_slots=6, jpeg_slots=4,
+                 queue_size=2, jpeg_quality=80, draw_overlays=True, skip_static=True, replay_rate=30.0,
+                 loop=False):
+        """
+        Sets up the shared memory rings and queues for the staged pipeline.
+        :param source_spec: Frame source description, see capture.frame_source.open_source.
+        :param width: Frame width used for every stage.
+        :param height: Frame height used for every stage.
+        :param frame_slots: Raw frame slots shared by capture, inference and encode.
+        :param jpeg_slots: Encoded frame slots shared by encode and the server.
+        :param queue_size: Maximum frames waiting in front of each stage.
+        :param jpeg_quality: Initial JPEG quality used by the encode stage.
+        :param draw_overlays: Draw tracking overlays into the frames. When False the
+            frames stay clean and the overlays only travel as metadata.
+        :param skip_static: Drop frames in which nothing changed right after capture.
+        :param replay_rate: Frames per second a recorded or synthetic source is replayed at,
+            or None for as fast as possible. Unthrottled, a short clip can be over before
+            the inference stage has loaded its model.
+        :param loop: Start a replayed source again from the first frame at its end.
+        """
+        # Spawned workers start clean, without the eventlet patches of the server process
+        self.ctx = mp.get_context("spawn")
+        self.source_spec = source_spec
+        self.width = width
+        self.height = height
+        self.draw_overlays = draw_overlays
+        self.skip_static = skip_static
+        self.replay_rate = replay_rate
+        self.loop = loop
+        # Read by the encode stage for every frame, so they can be changed while running
+        self.jpeg_quality = self.ctx.Value('i', jpeg_quality, lock=False)
+        self.jpeg_scale = self.ctx.Value('d', 1.0, lock=False)
+        self.jpeg_interval = self.ctx.Value('d', 0.0, lock=False)  # Least seconds between encoded frames
+
+        self.frames = SharedFrameRing(frame_slots, (height, width, 3))
+        # A JPEG is never larger than the raw frame it came from
+        self.jpegs = SharedFrameRing(jpeg_slots, (height * width * 3,))
+
+        self.free_frames = self.ctx.Queue()
+        self.free_jpegs = self.ctx.Queue()
+        for slot in range(frame_slots):
+            self.free_frames.put(slot)
+        for slot in range(jpeg_slots):
+            self.free_jpegs.put(slot)
+
+        self.to_inference = self.ctx.Queue(queue_size)
+        self.to_encode = self.ctx.Queue(queue_size)
+        self.to_server = self.ctx.Queue(queue_size)
+        self.stop_event = self.ctx.Event()
+        self.processes = []
+
+    def start(self):
+        """Launches the stage processes. Returns self so it can be chained."""
+        stages = [
+            (_capture_stage, (self.source_spec, self.width, self.height, self.replay_rate, self.loop,
+                              self.frames.spec(), self.free_frames, self.to_inference, self.skip_static,
+                              self.stop_event)),
+            (_inference_stage, (self.frames.spec(), self.free_frames, self.to_inference,
+                                self.to_encode, self.draw_overlays, self.stop_event)),
+            (_encode_stage, (self.frames.spec(), self.jpegs.spec(), self.free_frames, self.free_jpegs,
+                             self.to_encode, self.to_server, self.jpeg_quality, self.jpeg_scale,
+                             self.jpeg_interval, self.stop_event)),
+        ]
+        for target, args in stages:
+            process = self.ctx.Process(target=target, args=args, name=target.__name__.strip('_'), daemon=True)
+            process.start()
+            self.processes.append(process)
+        return self
+
+    def set_encoding(self, quality, scale=1.0, fps=None):
+        """
+        Changes JPEG quality, output scale and frame rate of the encode stage.
+        :param fps: Most frames per second to encode; frames in between reach the
+            server without a JPEG. None encodes every frame.
+        """
+        self.jpeg_quality.value = int(quality)
+        self.jpeg_scale.value = float(scale)
+        self.jpeg_interval.value = 1.0 / fps if fps else 0.0
+
+    def poll(self):
+        """
+        Returns the newest encoded frame without blocking, or None if there is none.
+        Older frames still waiting are skipped.
+        """
+        item = None
+        while True:
+            try:
+                newer = self.to_server.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[0] is not None:
+                self.free_jpegs.put(item[0])
+            item = newer
+        if item is None:
+            return None
+
+        jpeg_slot, length, seq, timestamp, error, timings, metadata = item
+        if jpeg_slot is None:
+            return EncodedFrame(None, seq, timestamp, error, timings, metadata)
+        # Copy out so the slot can go straight back to the encoder
+        jpeg = self.jpegs.slot(jpeg_slot)[:length].tobytes()
+        self.free_jpegs.put(jpeg_slot)
+        return EncodedFrame(jpeg, seq, timestamp, error, timings, metadata)
+
+    def stop(self):
+        """Stops every stage and frees the shared memory."""
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self.frames.close()
+        self.jpegs.close()
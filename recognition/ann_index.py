@@ -0,0 +1,312 @@
+import numpy as np
+
+
+class _InvertedList:
+    def __init__(self, dim, dtype, capacity=16):
+        """Growable storage for the vectors (or their codes) of one cluster."""
+        self.vectors = np.zeros((capacity, dim), dtype=dtype)
+        self.norms = np.zeros(capacity, dtype=np.float32)  # Squared norm of each stored vector
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+
+    def append(self, vectors, norms, ids):
+        end = self.size + len(vectors)
+        if end > len(self.ids):
+            capacity = max(end, 2 * len(self.ids))
+            self.vectors = np.resize(self.vectors, (capacity, self.vectors.shape[1]))
+            self.norms = np.resize(self.norms, capacity)
+            self.ids = np.resize(self.ids, capacity)
+        self.vectors[self.size:end] = vectors
+        self.norms[self.size:end] = norms
+        self.ids[self.size:end] = ids
+        self.size = end
+
+    def remove(self, pos):
+        """Removes the entry at pos by moving the last one into its place. Returns the moved ID or None."""
+        last = self.size - 1
+        moved = None
+        if pos != last:
+            self.vectors[pos] = self.vectors[last]
+            self.norms[pos] = self.norms[last]
+            self.ids[pos] = self.ids[last]
+            moved = int(self.ids[pos])
+        self.size = last
+        return moved
+
+
+class IVFIndex:
+    def __init__(self, dim, nlist=None, nprobe=8, metric="l2", quantize=True, min_train_size=1024,
+                 kmeans_iterations=15, seed=0):
+        """
+        Approximate nearest neighbour index (inverted file with scalar quantization).
+        Vectors are clustered with k-means into nlist lists and a query only scans
+        the nprobe lists with the nearest centroids, so search time grows with
+        about the square root of the gallery instead of linearly. With quantize,
+        each dimension is stored as one byte, a quarter of the float32 memory.
+        Until min_train_size vectors have been added the index is an exact flat scan.
+        :param dim: Vector length.
+        :param nlist: Number of clusters; defaults to sqrt(size) when trained.
+        :param nprobe: Clusters scanned per query. The recall vs. speed knob:
+            nprobe == nlist is an exact search over the quantized vectors.
+        :param metric: "l2" (Euclidean distance) or "cosine" (1 - cosine similarity).
+        :param quantize: Store 8-bit codes instead of float32 vectors once trained.
+        """
+        if metric not in ("l2", "cosine"):
+            raise ValueError(f"Unknown metric {metric}")
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.metric = metric
+        self.quantize = quantize
+        self.min_train_size = min_train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.rng = np.random.default_rng(seed)
+
+        self.trained = False
+        self.centroids = None
+        self.sq_min = None
+        self.sq_scale = None
+        self.lists = [_InvertedList(dim, np.float32)]
+        self.locations = {}  # id -> (list, position)
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.locations)
+
+    def _prepare(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors
+
+    def _encode(self, vectors):
+        """Storage form of prepared vectors and the squared norms used by the distance."""
+        if not (self.trained and self.quantize):
+            return vectors, np.einsum('ij,ij->i', vectors, vectors)
+        codes = np.clip(np.rint((vectors - self.sq_min) / self.sq_scale), 0, 255).astype(np.uint8)
+        decoded = codes * self.sq_scale
+        return codes, np.einsum('ij,ij->i', decoded, decoded)
+
+    def _decode(self, inv):
+        vectors = inv.vectors[:inv.size]
+        if self.trained and self.quantize:
+            return vectors * self.sq_scale + self.sq_min
+        return vectors.astype(np.float32)
+
+    def vectors(self):
+        """(ids, vectors) of everything in the index, decoded if quantized."""
+        ids = [inv.ids[:inv.size] for inv in self.lists]
+        vectors = [self._decode(inv) for inv in self.lists]
+        return np.concatenate(ids), np.concatenate(vectors).reshape(-1, self.dim)
+
+    def train(self, vectors=None):
+        """
+        Clusters the given vectors (default: the ones already stored) and moves
+        every stored vector into its cluster.
+        """
+        stored_ids, stored = self.vectors()
+        sample = stored if vectors is None else self._prepare(vectors)
+        if not len(sample):
+            return
+        nlist = self.nlist or max(1, int(round(np.sqrt(len(sample)))))
+        nlist = min(nlist, len(sample))
+        if len(sample) > 64 * nlist:
+            sample = sample[self.rng.choice(len(sample), 64 * nlist, replace=False)]
+        self.centroids = self._kmeans(sample, nlist)
+
+        # Per-dimension range for the 8-bit codes, with a margin for later inserts
+        low, high = sample.min(axis=0), sample.max(axis=0)
+        margin = 0.05 * (high - low)
+        self.sq_min = (low - margin).astype(np.float32)
+        self.sq_scale = np.maximum((high - low + 2 * margin) / 255.0, 1e-8).astype(np.float32)
+
+        self.trained = True
+        dtype = np.uint8 if self.quantize else np.float32
+        self.lists = [_InvertedList(self.dim, dtype) for _ in range(nlist)]
+        self.locations = {}
+        self._insert(stored, stored_ids)
+
+    def _kmeans(self, x, k):
+        centroids = x[self.rng.choice(len(x), k, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            assign = self._nearest_centroids(x, centroids)
+            # Cluster sums from one sorted pass; much faster than np.add.at
+            order = np.argsort(assign, kind='stable')
+            counts = np.bincount(assign, minlength=k)
+            filled = np.flatnonzero(counts)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+            centroids[filled] = np.add.reduceat(x[order], starts, axis=0) / counts[filled, None]
+            empty = counts == 0
+            if empty.any():
+                # Restart empty clusters on random points
+                centroids[empty] = x[self.rng.choice(len(x), int(empty.sum()), replace=False)]
+        return centroids
+
+    @staticmethod
+    def _nearest_centroids(x, centroids, n=1):
+        sq = np.einsum('ij,ij->i', centroids, centroids)[None, :] - 2.0 * (x @ centroids.T)
+        if n == 1:
+            return np.argmin(sq, axis=1)
+        if n >= len(centroids):
+            return np.broadcast_to(np.arange(len(centroids)), (len(x), len(centroids)))
+        return np.argpartition(sq, n - 1, axis=1)[:, :n]
+
+    def build(self, vectors, ids=None):
+        """Replaces the contents with vectors, training the clusters if there are enough."""
+        self.trained = False
+        self.centroids = None
+        self.lists = [_InvertedList(self.dim, np.float32)]
+        self.locations = {}
+        return self.add(vectors, ids)
+
+    def add(self, vectors, ids=None):
+        """
+        Inserts vectors, replacing any with the same ID.
+        :param ids: Integer IDs; consecutive new ones are assigned if None.
+        :return: Array of the IDs used.
+        """
+        vectors = self._prepare(vectors)
+        if ids is None:
+            ids = np.arange(self.next_id, self.next_id + len(vectors))
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if len(ids) != len(vectors):
+            raise ValueError("Need one ID per vector")
+        self.remove([i for i in ids.tolist() if i in self.locations])
+        if len(ids):
+            self.next_id = max(self.next_id, int(ids.max()) + 1)
+        self._insert(vectors, ids)
+
+        if not self.trained and len(self) >= self.min_train_size:
+            self.train()
+        return ids
+
+    def _insert(self, vectors, ids):
+        if not len(vectors):
+            return
+        assign = self._nearest_centroids(vectors, self.centroids) if self.trained else np.zeros(len(vectors), dtype=int)
+        stored, norms = self._encode(vectors)
+        for l in np.unique(assign).tolist():
+            rows = np.flatnonzero(assign == l)
+            inv = self.lists[l]
+            start = inv.size
+            inv.append(stored[rows], norms[rows], ids[rows])
+            for pos, i in enumerate(ids[rows].tolist(), start):
+                self.locations[i] = (l, pos)
+
+    def remove(self, ids):
+        """Deletes vectors by ID. Unknown IDs are ignored. Returns the number removed."""
+        removed = 0
+        for i in np.asarray(ids, dtype=np.int64).reshape(-1).tolist():
+            location = self.locations.pop(i, None)
+            if location is None:
+                continue
+            l, pos = location
+            moved = self.lists[l].remove(pos)
+            if moved is not None:
+                self.locations[moved] = (l, pos)
+            removed += 1
+        return removed
+
+    def search(self, queries, k=1, nprobe=None):
+        """
+        :param queries: (Q, dim) query vectors.
+        :param nprobe: Overrides the index's nprobe for this search.
+        :return: (ids, distances), both (Q, k) and sorted best first. Missing
+            results (fewer than k vectors scanned) have ID -1 and infinite distance.
+        """
+        queries = self._prepare(queries)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        if not len(queries) or not len(self):
+            return ids, distances
+
+        if self.trained:
+            probes = self._nearest_centroids(queries, self.centroids, nprobe or self.nprobe).reshape(len(queries), -1)
+        else:
+            probes = np.zeros((len(queries), 1), dtype=int)
+
+        candidates_d = [[] for _ in range(len(queries))]
+        candidates_i = [[] for _ in range(len(queries))]
+        q_sq = np.einsum('ij,ij->i', queries, queries)
+        for l in np.unique(probes).tolist():
+            inv = self.lists[l]
+            if inv.size == 0:
+                continue
+            rows = np.flatnonzero((probes == l).any(axis=1))
+            sq = self._list_distances(inv, queries[rows], q_sq[rows])
+            for r, q in enumerate(rows.tolist()):
+                candidates_d[q].append(sq[r])
+                candidates_i[q].append(inv.ids[:inv.size])
+
+        for q in range(len(queries)):
+            if not candidates_d[q]:
+                continue
+            sq = np.concatenate(candidates_d[q])
+            cand = np.concatenate(candidates_i[q])
+            n = min(k, len(sq))
+            best = np.argpartition(sq, n - 1)[:n] if n < len(sq) else np.arange(n)
+            best = best[np.argsort(sq[best])]
+            ids[q, :n] = cand[best]
+            distances[q, :n] = sq[best]
+
+        found = ids >= 0
+        np.maximum(distances, 0.0, out=distances, where=found)
+        if self.metric == "cosine":
+            distances[found] *= 0.5  # |a - b|^2 / 2 == 1 - cos for unit vectors
+        else:
+            np.sqrt(distances, out=distances, where=found)
+        return ids, distances
+
+    def _list_distances(self, inv, queries, q_sq):
+        """Squared distances (Q, size) between queries and every vector of a list."""
+        vectors = inv.vectors[:inv.size]
+        if self.trained and self.quantize:
+            # |q - (min + c*scale)|^2 without decoding: shift the query instead
+            shifted = queries - self.sq_min
+            dots = (shifted * self.sq_scale) @ vectors.T
+            return np.einsum('ij,ij->i', shifted, shifted)[:, None] - 2.0 * dots + inv.norms[None, :inv.size]
+        return q_sq[:, None] - 2.0 * (queries @ vectors.T) + inv.norms[None, :inv.size]
+
+    def save(self, path):
+        """Writes the index to a single .npz file."""
+        sizes = np.array([inv.size for inv in self.lists], dtype=np.int64)
+        with open(path, 'wb') as f:
+            np.savez(f,
+                     dim=self.dim, nprobe=self.nprobe, metric=self.metric, quantize=self.quantize,
+                     trained=self.trained, next_id=self.next_id,
+                     centroids=self.centroids if self.trained else np.zeros((0, self.dim), np.float32),
+                     sq_min=self.sq_min if self.trained else np.zeros(self.dim, np.float32),
+                     sq_scale=self.sq_scale if self.trained else np.ones(self.dim, np.float32),
+                     sizes=sizes,
+                     vectors=np.concatenate([inv.vectors[:inv.size] for inv in self.lists]),
+                     norms=np.concatenate([inv.norms[:inv.size] for inv in self.lists]),
+                     ids=np.concatenate([inv.ids[:inv.size] for inv in self.lists]))
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Reads an index written by save. kwargs override constructor settings such as nprobe."""
+        with np.load(path, allow_pickle=False) as data:
+            settings = dict(dim=int(data["dim"]), nprobe=int(data["nprobe"]), metric=str(data["metric"]),
+                            quantize=bool(data["quantize"]))
+            settings.update(kwargs)
+            index = cls(**settings)
+            index.trained = bool(data["trained"])
+            index.next_id = int(data["next_id"])
+            if index.trained:
+                index.centroids = data["centroids"]
+                index.sq_min = data["sq_min"]
+                index.sq_scale = data["sq_scale"]
+                index.nlist = len(index.centroids)
+            dtype = data["vectors"].dtype
+            index.lists = []
+            start = 0
+            for l, size in enumerate(data["sizes"].tolist()):
+                inv = _InvertedList(index.dim, dtype, capacity=max(size, 16))
+                inv.append(data["vectors"][start:start + size], data["norms"][start:start + size],
+                           data["ids"][start:start + size])
+                for pos, i in enumerate(inv.ids[:size].tolist()):
+                    index.locations[i] = (l, pos)
+                index.lists.append(inv)
+                start += size
+        return index
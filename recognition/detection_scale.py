@@ -0,0 +1,118 @@
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class FrameScaler:
+    def __init__(self, conversion=cv2.COLOR_BGR2RGB):
+        """
+        Downscales and colour-converts frames into buffers that are allocated once
+        per output size and reused for every later frame of that size. The returned
+        array is overwritten by the next call with the same size; copy it to keep it.
+        :param conversion: cv2 colour conversion applied after resizing, e.g. COLOR_BGR2GRAY.
+        """
+        self.conversion = conversion
+        self.buffers = {}  # (width, height, channels) -> (resized, converted)
+
+    def __call__(self, frame, scale):
+        height, width = frame.shape[:2]
+        size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        key = size + frame.shape[2:]
+        resized, converted = self.buffers.get(key, (None, None))
+        if scale == 1.0:
+            resized = frame
+        else:
+            if resized is None:
+                resized = np.empty((size[1], size[0]) + frame.shape[2:], dtype=frame.dtype)
+            cv2.resize(frame, size, dst=resized, interpolation=cv2.INTER_AREA)
+        if converted is None:
+            converted = cv2.cvtColor(resized, self.conversion)
+        else:
+            cv2.cvtColor(resized, self.conversion, dst=converted)
+        self.buffers[key] = (None if scale == 1.0 else resized, converted)
+        return converted
+
+
+class DetectionScalePolicy:
+    def __init__(self, scales=(0.25, 0.5, 1.0), detector_min_face=40, min_face=80, margin=1.25,
+                 memory=1.0, search_interval=0.5):
+        """
+        Picks the downscale factor face detection runs at, per frame.
+        While faces are in view the coarsest scale at which the smallest of them is
+        still comfortably above the detector's limit is used, so close faces are
+        cheap, and every search_interval seconds one frame is detected at the finest
+        usable scale so a second, farther face walking in is not missed. When nothing
+        is seen, or faces were just lost, the frame is searched as a pyramid from
+        coarse to fine and the search stops at the first scale that finds a face; with
+        an empty scene the pyramid runs only every search_interval seconds and the
+        other frames get the coarsest scale.
+        :param scales: Available downscale factors.
+        :param detector_min_face: Smallest face, in pixels at detection scale, the detector finds reliably.
+        :param min_face: Smallest face, in full frame pixels, that must still be found, i.e. the
+            farthest distance we engage at. No scale finer than this needs is used.
+        :param margin: How far above detector_min_face the smallest recent face has to be.
+        :param memory: Seconds a seen face size is taken into account.
+        :param search_interval: Seconds between searches for faces too small for the current scale.
+        """
+        self.scales = sorted(scales)
+        self.detector_min_face = detector_min_face
+        self.margin = margin
+        self.memory = memory
+        self.search_interval = search_interval
+        enough = [s for s in self.scales if min_face * s >= detector_min_face]
+        self.finest = enough[0] if enough else self.scales[-1]
+        self.usable = [s for s in self.scales if s <= self.finest]
+
+        self.recent = deque()  # (time, smallest face size in full frame pixels)
+        self.last_found = False
+        self.last_search = float('-inf')
+        self.scale = self.usable[0]  # Scale of the last successful or final attempt
+        self.attempts = 0
+
+    def plan(self, now):
+        """Scales to try on this frame, in order, until one finds a face."""
+        while self.recent and now - self.recent[0][0] > self.memory:
+            self.recent.popleft()
+        search = now - self.last_search >= self.search_interval
+        if search:
+            self.last_search = now
+        if self.recent:
+            if search:
+                # The finest usable scale finds every face down to min_face, near ones included
+                return self.usable[-1:]
+            smallest = min(size for _, size in self.recent)
+            needed = self.detector_min_face * self.margin
+            start = next((i for i, s in enumerate(self.usable) if smallest * s >= needed), len(self.usable) - 1)
+            # Faces were just lost: look finer before giving up on them
+            return self.usable[start:] if not self.last_found else self.usable[start:start + 1]
+        if search:
+            return self.usable
+        return self.usable[:1]
+
+    def observe(self, boxes, now):
+        """Remembers the size of the faces found in a frame."""
+        boxes = np.asarray(boxes).reshape(-1, 4)
+        self.last_found = len(boxes) > 0
+        if self.last_found:
+            # Works for (left, top, right, bottom) as well as (top, right, bottom, left)
+            sizes = np.minimum(np.abs(boxes[:, 2] - boxes[:, 0]), np.abs(boxes[:, 3] - boxes[:, 1]))
+            self.recent.append((now, int(sizes.min())))
+
+    def run(self, detect_at, now=None):
+        """
+        Detects on one frame using the planned scales.
+        :param detect_at: Called as detect_at(scale), returns (N, 4) boxes in full frame pixels.
+        :return: Boxes of the first scale that found any, or of the last scale tried.
+        """
+        now = time.time() if now is None else now
+        boxes = None
+        for scale in self.plan(now):
+            self.scale = scale
+            self.attempts += 1
+            boxes = detect_at(scale)
+            if len(boxes):
+                break
+        self.observe(boxes, now)
+        return boxes
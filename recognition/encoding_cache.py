@@ -0,0 +1,130 @@
+import hashlib
+import os
+
+import numpy as np
+
+# Bump when the file layout changes; older caches are then rebuilt
+CACHE_VERSION = 1
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-1 of a file's contents as a hex string."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EncodingCache:
+    def __init__(self, cache_path, model="face_recognition", dim=128):
+        """
+        Face encodings of gallery images, kept in a single .npz file between runs.
+        An entry is reused while the image's size and mtime are unchanged; if they
+        differ the contents are hashed, so a touched but identical file is not
+        re-encoded either. Images without a face are cached too.
+        :param cache_path: File the cache is stored in.
+        :param model: Name of the model that produced the encodings. A cache
+            written by another model is ignored.
+        :param dim: Length of one encoding; taken from the file if None.
+        """
+        self.cache_path = cache_path
+        self.model = model
+        self.dim = dim
+        self.entries = {}  # abspath -> (size, mtime_ns, digest, encoding or None)
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                if int(data["version"]) != CACHE_VERSION or str(data["model"]) != self.model:
+                    self.dirty = True
+                    return
+                encodings = data["encodings"]
+                if self.dim is None:
+                    self.dim = encodings.shape[1]
+                for path, size, mtime, digest, has_face, encoding in zip(
+                        data["paths"], data["sizes"], data["mtimes"], data["digests"],
+                        data["has_face"], encodings):
+                    self.entries[str(path)] = (int(size), int(mtime), str(digest),
+                                               encoding if has_face else None)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable encoding cache {self.cache_path}: {e}")
+            self.entries = {}
+            self.dirty = True
+
+    def get(self, path):
+        """
+        :return: (hit, encoding). encoding is None on a miss or if the cached image
+            had no face; hit tells the two apart.
+        """
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        size, mtime, digest, encoding = entry
+        stat = os.stat(path)
+        if stat.st_size == size and stat.st_mtime_ns == mtime:
+            self.hits += 1
+            return True, encoding
+        if stat.st_size == size and file_digest(path) == digest:
+            # Same bytes, only the timestamp moved
+            self.entries[key] = (size, stat.st_mtime_ns, digest, encoding)
+            self.dirty = True
+            self.hits += 1
+            return True, encoding
+        self.misses += 1
+        return False, None
+
+    def put(self, path, encoding, digest=None):
+        """
+        Stores the encoding of path, or None if the image has no face.
+        :param digest: file_digest of path if the caller already has it.
+        """
+        stat = os.stat(path)
+        if encoding is not None:
+            encoding = np.asarray(encoding, dtype=np.float64).reshape(self.dim)
+        digest = digest or file_digest(path)
+        self.entries[os.path.abspath(path)] = (stat.st_size, stat.st_mtime_ns, digest, encoding)
+        self.dirty = True
+
+    def prune(self, paths):
+        """Drops entries of images that are not in paths any more."""
+        keep = {os.path.abspath(p) for p in paths}
+        for key in list(self.entries):
+            if key not in keep:
+                del self.entries[key]
+                self.dirty = True
+
+    def save(self):
+        """Writes the cache if it changed. The file is replaced atomically."""
+        if not self.dirty:
+            return
+        paths = sorted(self.entries)
+        encodings = np.zeros((len(paths), self.dim or 0), dtype=np.float64)
+        has_face = np.zeros(len(paths), dtype=bool)
+        for i, path in enumerate(paths):
+            encoding = self.entries[path][3]
+            if encoding is not None:
+                encodings[i] = encoding
+                has_face[i] = True
+
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f,
+                     version=np.array(CACHE_VERSION),
+                     model=np.array(self.model),
+                     paths=np.array(paths, dtype=str),
+                     sizes=np.array([self.entries[p][0] for p in paths], dtype=np.int64),
+                     mtimes=np.array([self.entries[p][1] for p in paths], dtype=np.int64),
+                     digests=np.array([self.entries[p][2] for p in paths], dtype=str),
+                     has_face=has_face,
+                     encodings=encodings)
+        os.replace(tmp_path, self.cache_path)
+        self.dirty = False
@@ -0,0 +1,310 @@
+"""
+One face recognition pipeline with swappable embedding backends.
+
+A backend finds faces in a frame and turns face crops into embeddings. Models
+and cascades are loaded once when the backend is created, and all faces of a
+frame are embedded in a single batched call. The engine matches embeddings
+against a gallery of reference images grouped per person.
+
+    engine = RecognitionEngine("facenet", gallery_path="faces")
+    for face in engine.recognize(frame):
+        print(face.name, face.distance)
+"""
+import os
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from recognition.detection_scale import DetectionScalePolicy, FrameScaler
+from recognition.encoding_cache import EncodingCache
+from recognition.identities import IdentityGallery, identity_names, load_manifest
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# One recognized face. box is (left, top, right, bottom) in frame pixels.
+RecognizedFace = namedtuple("RecognizedFace", ["box", "name", "distance", "embedding"])
+
+
+class EmbeddingBackend:
+    name = None
+    dim = None
+    metric = "l2"
+    threshold = None  # Largest distance that still counts as a match
+
+    @classmethod
+    def cache_name(cls, **options):
+        """Name the gallery cache is stored under for a backend built with options."""
+        return cls.name
+
+    def detect(self, frame):
+        """(N, 4) face boxes (left, top, right, bottom) in frame pixels."""
+        raise NotImplementedError
+
+    def embed(self, frame, boxes):
+        """(N, dim) embeddings of the faces in boxes, computed in one batch."""
+        raise NotImplementedError
+
+    def detect_image(self, image):
+        """
+        Face boxes in a still image, searched at full resolution. Unlike detect it
+        keeps no per-frame state, so it is safe to call from another thread.
+        """
+        raise NotImplementedError
+
+    def embed_image(self, image):
+        """Embedding of the first face in a gallery image, or None if it has none."""
+        boxes = self.detect_image(image)
+        if not len(boxes):
+            return None
+        return self.embed(image, boxes[:1])[0]
+
+
+class _CascadeDetector:
+    def __init__(self, scale_factor=1.3, min_neighbors=5, min_size=(30, 30), min_face=30):
+        """
+        OpenCV frontal face cascade, loaded once. Frames are downscaled per frame
+        as far as recently seen faces allow.
+        :param min_face: Smallest face in full frame pixels that must still be found.
+        """
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.scale_policy = DetectionScalePolicy(detector_min_face=min(min_size), min_face=min_face)
+        self.scaler = FrameScaler(cv2.COLOR_BGR2GRAY)
+
+    def detect(self, frame):
+        return self.scale_policy.run(lambda scale: self._detect_at(frame, scale))
+
+    def detect_image(self, image):
+        # Fresh buffer and no scale policy: gallery images must not disturb live detection
+        return self._detect_gray(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), 1.0)
+
+    def _detect_at(self, frame, scale):
+        return self._detect_gray(self.scaler(frame, scale), scale)
+
+    def _detect_gray(self, gray, scale):
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                              minNeighbors=self.min_neighbors, minSize=self.min_size)
+        faces = (np.asarray(faces, dtype=float).reshape(-1, 4) / scale).astype(int)
+        return np.column_stack((faces[:, :2], faces[:, :2] + faces[:, 2:]))
+
+
+def _crop_batch(frame, boxes, size):
+    """Face crops resized to size and stacked into one (N, h, w, 3) float32 batch scaled to [0, 1]."""
+    batch = np.empty((len(boxes), size[1], size[0], 3), dtype=np.float32)
+    for i, (left, top, right, bottom) in enumerate(boxes):
+        batch[i] = cv2.resize(frame[top:bottom, left:right], size)
+    batch /= 255.0
+    return batch
+
+
+class FaceRecognitionBackend(EmbeddingBackend):
+    name = "face_recognition"
+    dim = 128
+    metric = "l2"
+    threshold = 0.6
+
+    def __init__(self, frame_resizing=None, min_face=80):
+        """
+        dlib HOG detector and ResNet encoder from the face_recognition package.
+        :param frame_resizing: Fixed scale frames are detected and encoded at. By default
+            it is picked per frame from the size of recently seen faces.
+        :param min_face: Smallest face in full frame pixels that must still be found.
+        """
+        import face_recognition
+        self.face_recognition = face_recognition
+        scales = (frame_resizing,) if frame_resizing else (0.25, 0.5, 1.0)
+        self.scale_policy = DetectionScalePolicy(scales, detector_min_face=40, min_face=min_face)
+        self.frame_resizing = self.scale_policy.scale  # Scale of the last detection, embed uses it too
+        self.scaler = FrameScaler(cv2.COLOR_BGR2RGB)
+
+    def _small(self, frame):
+        return self.scaler(frame, self.frame_resizing)
+
+    def detect(self, frame):
+        return self.scale_policy.run(lambda scale: self._detect_at(frame, scale))
+
+    def _detect_at(self, frame, scale):
+        self.frame_resizing = scale
+        locations = np.asarray(self.face_recognition.face_locations(self._small(frame)), dtype=int).reshape(-1, 4)
+        boxes = locations[:, [3, 0, 1, 2]]  # (left, top, right, bottom)
+        return (boxes / scale).astype(int)
+
+    def embed(self, frame, boxes):
+        small = (np.asarray(boxes).reshape(-1, 4) * self.frame_resizing).astype(int)
+        locations = [(top, right, bottom, left) for left, top, right, bottom in small.tolist()]
+        encodings = self.face_recognition.face_encodings(self._small(frame), locations)
+        return np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+
+    def detect_image(self, image):
+        locations = self.face_recognition.face_locations(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        return np.asarray(locations, dtype=int).reshape(-1, 4)[:, [3, 0, 1, 2]]
+
+    def embed_image(self, image):
+        # Gallery images are encoded at full resolution, as SimpleFacerec does
+        encodings = self.face_recognition.face_encodings(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        return np.asarray(encodings[0], dtype=np.float32) if encodings else None
+
+
+class FaceNetBackend(EmbeddingBackend):
+    name = "facenet"
+    dim = 128
+    metric = "cosine"
+    threshold = 0.5
+
+    def __init__(self, model_path="facenet_keras.h5"):
+        """Haar cascade detector and a Keras FaceNet model."""
+        from tensorflow.keras.models import load_model
+        self.model = load_model(model_path, compile=False)
+        self.input_size = (160, 160)
+        self.dim = int(self.model.output_shape[-1])
+        self.detector = _CascadeDetector()
+
+    def detect(self, frame):
+        return self.detector.detect(frame)
+
+    def detect_image(self, image):
+        return self.detector.detect_image(image)
+
+    def embed(self, frame, boxes):
+        if not len(boxes):
+            return np.zeros((0, self.dim), dtype=np.float32)
+        batch = _crop_batch(frame, boxes, self.input_size)
+        return np.asarray(self.model.predict(batch, verbose=0), dtype=np.float32)
+
+
+class DeepFaceBackend(EmbeddingBackend):
+    name = "deepface"
+    metric = "cosine"
+    # DeepFace's cosine distance thresholds for the models it ships
+    THRESHOLDS = {"VGG-Face": 0.68, "Facenet": 0.40, "Facenet512": 0.30, "ArcFace": 0.68, "SFace": 0.593}
+
+    def __init__(self, model_name="VGG-Face"):
+        """Haar cascade detector and a DeepFace recognition model, built once."""
+        from deepface import DeepFace
+        client = DeepFace.build_model(model_name)
+        self.model = client.model  # The underlying Keras model, called directly with a batch
+        self.input_size = tuple(client.input_shape)
+        self.dim = int(client.output_shape)
+        self.name = self.cache_name(model_name=model_name)
+        self.threshold = self.THRESHOLDS.get(model_name, 0.4)
+        self.detector = _CascadeDetector()
+
+    @classmethod
+    def cache_name(cls, model_name="VGG-Face", **options):
+        return f"deepface-{model_name.lower()}"
+
+    def detect(self, frame):
+        return self.detector.detect(frame)
+
+    def detect_image(self, image):
+        return self.detector.detect_image(image)
+
+    def embed(self, frame, boxes):
+        if not len(boxes):
+            return np.zeros((0, self.dim), dtype=np.float32)
+        batch = _crop_batch(frame, boxes, self.input_size)
+        return np.asarray(self.model(batch, training=False), dtype=np.float32).reshape(len(boxes), -1)
+
+
+BACKENDS = {
+    "face_recognition": FaceRecognitionBackend,
+    "facenet": FaceNetBackend,
+    "deepface": DeepFaceBackend,
+}
+
+
+class RecognitionEngine:
+    def __init__(self, backend="face_recognition", gallery_path="faces", threshold=None, use_cache=True,
+                 workers=0, **backend_options):
+        """
+        :param backend: Name from BACKENDS or an EmbeddingBackend instance.
+        :param gallery_path: Directory of reference images, one face each, named after the
+            person ("gerald.jpg", "gerald1.jpg", ...) or listed in its manifest.json.
+        :param threshold: Largest match distance; defaults to the backend's.
+        :param use_cache: Keep gallery embeddings in a cache file inside gallery_path.
+        :param workers: Embed new gallery images with this many processes first
+            (see recognition.enroll). Needs a backend name and use_cache.
+        :param backend_options: Passed to the backend constructor.
+        """
+        self.backend = BACKENDS[backend](**backend_options) if isinstance(backend, str) else backend
+        self.threshold = threshold if threshold is not None else self.backend.threshold
+        self.use_cache = use_cache
+        self.workers = workers if isinstance(backend, str) else 0
+        self.backend_spec = (backend, backend_options)
+        self.gallery = IdentityGallery(self.backend.dim, self.backend.metric)
+        if gallery_path:
+            self.load_gallery(gallery_path)
+
+    def cache_path(self, gallery_path):
+        return os.path.join(gallery_path, f".{self.backend.name}_encodings.npz")
+
+    def load_gallery(self, gallery_path):
+        """Embeds every image in gallery_path (cached ones are reused) and replaces the gallery."""
+        cache = None
+        if self.use_cache and self.workers:
+            # Imported here; enroll imports this module for the backends
+            from recognition.enroll import enroll
+            backend, backend_options = self.backend_spec
+            enroll(gallery_path, backend, self.workers, self.cache_path(gallery_path), **backend_options)
+        if self.use_cache:
+            cache = EncodingCache(self.cache_path(gallery_path), model=self.backend.name, dim=self.backend.dim)
+        files = sorted(os.listdir(gallery_path))
+        identities = identity_names(files, load_manifest(gallery_path))
+        names, embeddings, img_paths = [], [], []
+        for file in files:
+            if file.startswith('.') or not file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            img_path = os.path.join(gallery_path, file)
+            img_paths.append(img_path)
+            hit, embedding = cache.get(img_path) if cache is not None else (False, None)
+            if not hit:
+                image = cv2.imread(img_path)
+                embedding = self.backend.embed_image(image) if image is not None else None
+                if cache is not None:
+                    cache.put(img_path, embedding)
+            if embedding is None:
+                print(f"Warning: No face found in {file}")
+                continue
+            names.append(identities[file])
+            embeddings.append(embedding)
+
+        if cache is not None:
+            cache.prune(img_paths)
+            cache.save()
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.backend.dim)
+        self.gallery = IdentityGallery(self.backend.dim, self.backend.metric, names, embeddings)
+
+    def watch_gallery(self, gallery_path, interval=2.0):
+        """
+        Reloads the gallery in the background whenever images in gallery_path are
+        added, changed or removed. Returns the started GalleryWatcher.
+        """
+        # Imported here; the watcher imports this module
+        from recognition.gallery_watcher import GalleryWatcher
+        return GalleryWatcher(gallery_path, lambda: self.load_gallery(gallery_path), interval).start()
+
+    def recognize(self, frame):
+        """Detects, embeds (in one batch) and names every face in frame. Returns a list of RecognizedFace."""
+        boxes = self.backend.detect(frame)
+        if not len(boxes):
+            return []
+        embeddings = self.backend.embed(frame, boxes)
+        gallery = self.gallery
+        names, distances = gallery.search(embeddings, 1)
+        faces = []
+        for box, embedding, match, distance in zip(boxes.tolist(), embeddings, names, distances[:, 0].tolist()):
+            name = match[0] if match and distance <= self.threshold else "Unknown"
+            faces.append(RecognizedFace(tuple(box), name, distance, embedding))
+        return faces
+
+    @staticmethod
+    def draw(frame, faces):
+        """Draws a box and name for each face; known faces green, unknown red."""
+        for face in faces:
+            left, top, right, bottom = face.box
+            color = (0, 255, 0) if face.name != "Unknown" else (0, 0, 255)
+            cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+            cv2.putText(frame, face.name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
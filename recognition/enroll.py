@@ -0,0 +1,174 @@
+"""
+Bulk enrollment of a gallery directory into the encoding cache.
+
+Decoding, face detection and embedding run in a pool of worker processes that
+each build the backend once. Results are written to the same cache file
+RecognitionEngine.load_gallery reads, and the file is saved periodically, so an
+interrupted run picks up where it stopped: images already in the cache are
+skipped.
+
+    python -m recognition.enroll faces --backend face_recognition --workers 8
+"""
+import argparse
+import hashlib
+import multiprocessing as mp
+import os
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from recognition.encoding_cache import EncodingCache
+from recognition.engine import BACKENDS, IMAGE_EXTENSIONS
+
+EnrollmentReport = namedtuple("EnrollmentReport", ["total", "cached", "enrolled", "no_face", "failed", "seconds"])
+
+# Backend of the current worker process, built once by _init_worker
+_backend = None
+# Why building it failed. An initializer that raises makes the pool respawn the
+# worker forever, so the error is kept and reported through _backend_dim instead.
+_backend_error = None
+
+
+def _init_worker(backend, backend_options):
+    global _backend, _backend_error
+    try:
+        _backend = BACKENDS[backend](**backend_options)
+    except Exception as e:
+        _backend_error = f"{type(e).__name__}: {e}"
+
+
+def _backend_dim():
+    """(embedding size, None), or (None, error message) if the worker has no backend."""
+    if _backend is None:
+        return None, _backend_error
+    return _backend.dim, None
+
+
+def _embed_file(img_path):
+    """
+    Runs in a worker. The file is read once for both the cache digest and decoding.
+    :return: (path, embedding or None, digest, error message or None).
+    """
+    try:
+        with open(img_path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return img_path, None, digest, "Could not decode image"
+        embedding = _backend.embed_image(image)
+        return img_path, None if embedding is None else np.asarray(embedding, dtype=np.float32), digest, None
+    except Exception as e:
+        return img_path, None, None, f"{type(e).__name__}: {e}"
+
+
+def list_images(gallery_path):
+    return [os.path.join(gallery_path, file) for file in sorted(os.listdir(gallery_path))
+            if not file.startswith('.') and file.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def print_progress(done, total, img_path, error, elapsed):
+    """Default progress reporter: one line per failure and a status line about once a second."""
+    if error is not None:
+        print(f"Failed: {img_path}: {error}")
+    now = time.time()
+    if done == total or now - print_progress.last >= 1.0:
+        print_progress.last = now
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 else float('inf')
+        print(f"[{done}/{total}] {rate:.1f} images/s, ETA {eta:.0f} s")
+
+
+print_progress.last = 0.0
+
+
+def enroll(gallery_path, backend="face_recognition", workers=None, cache_path=None, progress=print_progress,
+           save_interval=10.0, chunksize=4, **backend_options):
+    """
+    Embeds every image in gallery_path that is not cached yet, using a process pool.
+    :param backend: Backend name from recognition.engine.BACKENDS.
+    :param workers: Worker processes; defaults to one per core.
+    :param cache_path: Cache file; defaults to the one RecognitionEngine uses for the backend.
+    :param progress: Called as progress(done, total, img_path, error, elapsed) after every
+        image that had to be embedded, or None for no reporting.
+    :param save_interval: Seconds between cache saves while running.
+    :return: EnrollmentReport; failed lists (path, error) pairs. Failed images are not
+        cached, so the next run tries them again.
+    """
+    start = time.time()
+    img_paths = list_images(gallery_path)
+    workers = workers or os.cpu_count() or 1
+    failed = []
+    enrolled = no_face = 0
+
+    name = BACKENDS[backend].cache_name(**backend_options)
+    if cache_path is None:
+        cache_path = os.path.join(gallery_path, f".{name}_encodings.npz")
+    cache = EncodingCache(cache_path, model=name, dim=None)
+    pending = [p for p in img_paths if not cache.get(p)[0]]
+    cached = len(img_paths) - len(pending)
+    cache.prune(img_paths)
+    if not pending:
+        # Nothing to embed, so don't pay for starting workers and loading models
+        cache.save()
+        return EnrollmentReport(len(img_paths), cached, 0, 0, failed, time.time() - start)
+
+    # Spawned workers start clean and build their own copy of the backend
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(min(workers, len(pending)), initializer=_init_worker, initargs=(backend, backend_options)) as pool:
+        cache.dim, error = pool.apply(_backend_dim)
+        if error is not None:
+            raise RuntimeError(f"Could not build the {backend} backend: {error}")
+        last_save = time.time()
+        try:
+            for done, (img_path, embedding, digest, error) in enumerate(
+                    pool.imap_unordered(_embed_file, pending, chunksize=chunksize), 1):
+                if error is not None:
+                    failed.append((img_path, error))
+                else:
+                    cache.put(img_path, embedding, digest)
+                    if embedding is None:
+                        no_face += 1
+                    else:
+                        enrolled += 1
+                if progress is not None:
+                    progress(done, len(pending), img_path, error, time.time() - start)
+                if time.time() - last_save >= save_interval:
+                    cache.save()
+                    last_save = time.time()
+        finally:
+            # Also runs on Ctrl+C, so finished images are kept for the next run
+            cache.save()
+
+    return EnrollmentReport(len(img_paths), cached, enrolled, no_face, failed, time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed a directory of face images into the gallery cache.")
+    parser.add_argument("gallery", help="Directory of reference images, named after the person")
+    parser.add_argument("--backend", default="face_recognition", choices=sorted(BACKENDS))
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--model-path", help="FaceNet model file (facenet backend)")
+    parser.add_argument("--model-name", help="DeepFace model name (deepface backend)")
+    args = parser.parse_args()
+
+    options = {}
+    if args.model_path:
+        options["model_path"] = args.model_path
+    if args.model_name:
+        options["model_name"] = args.model_name
+    try:
+        report = enroll(args.gallery, args.backend, args.workers, **options)
+    except KeyboardInterrupt:
+        print("Interrupted; progress so far is saved, run again to resume.")
+        return
+    print(f"{report.total} images: {report.cached} already cached, {report.enrolled} enrolled, "
+          f"{report.no_face} without a face, {len(report.failed)} failed in {report.seconds:.1f} s")
+    for img_path, error in report.failed:
+        print(f"  {img_path}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import time
+
+# Encoding a new image can take a while; on a green thread that would stall the
+# eventlet hub of the video servers, so always use a real OS thread.
+try:
+    from eventlet.patcher import original as _original
+    threading = _original("threading")
+except ImportError:
+    import threading
+
+from recognition.engine import IMAGE_EXTENSIONS
+from recognition.identities import MANIFEST_FILE
+
+
+class GalleryWatcher:
+    def __init__(self, gallery_path, reload, interval=2.0):
+        """
+        Polls a gallery directory and calls reload() on a background thread when
+        images are added, changed or removed. reload is expected to encode only
+        the changed images (through the encoding cache) and swap in the new
+        gallery in one assignment, so recognition keeps running meanwhile.
+        A change is only acted on once the directory has looked the same for two
+        polls in a row, so files still being copied are not read half-written.
+        :param gallery_path: Directory to watch.
+        :param reload: Callable without arguments that reloads the gallery.
+        :param interval: Seconds between polls.
+        """
+        self.gallery_path = gallery_path
+        self.reload = reload
+        self.interval = interval
+        self.loaded = self.snapshot()
+        self.pending = None
+        self.reloads = 0
+        self.last_reload_time = None
+        self.last_error = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def snapshot(self):
+        """{file name: (size, mtime)} of the gallery images and manifest."""
+        state = {}
+        try:
+            entries = list(os.scandir(self.gallery_path))
+        except OSError:
+            return state
+        for entry in entries:
+            if entry.name.startswith('.') or not (entry.name.lower().endswith(IMAGE_EXTENSIONS)
+                                                  or entry.name == MANIFEST_FILE):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # Removed between listing and stat
+            state[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return state
+
+    def start(self):
+        """Starts watching. Returns self so it can be chained."""
+        self.thread = threading.Thread(target=self._run, name="gallery-watcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 1.0)
+
+    def poll(self):
+        """Checks the directory once and reloads if it changed and has settled. Returns True after a reload."""
+        state = self.snapshot()
+        if state == self.loaded:
+            self.pending = None
+            return False
+        if state != self.pending:
+            self.pending = state  # Changed since the last poll, wait for it to settle
+            return False
+
+        start = time.time()
+        try:
+            self.reload()
+        except Exception as e:
+            # Keep serving the old gallery; the next change triggers another attempt
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Warning: Gallery reload failed: {self.last_error}")
+        else:
+            self.last_error = None
+            self.reloads += 1
+            self.last_reload_time = time.time() - start
+        self.loaded = state
+        self.pending = None
+        return self.last_error is None
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.poll()
@@ -0,0 +1,126 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from recognition.ann_index import IVFIndex
+
+# Optional file in a gallery directory mapping people to their images:
+# {"Gerald Ford": ["gerald.jpg", "gerald1.jpg"], ...}
+MANIFEST_FILE = "manifest.json"
+
+# "gerald_2", "gerald-03" and "gerald 4" are all photos of "gerald"
+_NUMBER_SUFFIX = re.compile(r"[ _-]+\d+$")
+# So is "gerald1", but only next to a "gerald" image: "r2d2" is a name of its own
+_BARE_NUMBER = re.compile(r"\d+$")
+
+
+def load_manifest(gallery_path):
+    """{file name: person} from the gallery's manifest, or {} if there is none."""
+    path = os.path.join(gallery_path, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        manifest = json.load(f)
+    return {file: person for person, files in manifest.items() for file in files}
+
+
+def identity_name(file, manifest=None, known=()):
+    """
+    Person an image belongs to: its manifest entry if there is one, otherwise the
+    file name without extension and without a trailing "_N", "-N" or " N". A number
+    right after the name is only dropped if what is left is in known.
+    :param known: Names that already stand for a person, e.g. the other file stems.
+    """
+    if manifest and file in manifest:
+        return manifest[file]
+    stem = os.path.splitext(file)[0]
+    name = _NUMBER_SUFFIX.sub("", stem)
+    if name != stem:
+        return name or stem
+    name = _BARE_NUMBER.sub("", stem)
+    return name if name and name in known else stem
+
+
+def identity_names(files, manifest=None):
+    """{file: identity_name} for the images of one gallery, which are known to each other."""
+    known = {os.path.splitext(file)[0] for file in files}
+    return {file: identity_name(file, manifest, known) for file in files}
+
+
+class IdentityGallery:
+    def __init__(self, dim, metric, names=(), embeddings=None, shortlist=5):
+        """
+        Reference embeddings grouped by person; images with the same name are one identity.
+        A probe is first compared with each identity's centroid (through an IVFIndex,
+        so this part scales with the number of people), and only the member images
+        of the shortlist nearest identities are compared exactly. An identity's
+        distance is that of its closest member, so enrolling more photos of a
+        person improves matching without adding a full comparison per photo.
+        :param names: Identity name of each embedding.
+        :param shortlist: Identities whose members are reranked per probe.
+        """
+        self.dim = dim
+        self.metric = metric
+        self.shortlist = shortlist
+        embeddings = np.asarray(embeddings if embeddings is not None else [], dtype=np.float32).reshape(-1, dim)
+        names = list(names)
+
+        self.names = list(dict.fromkeys(names))  # One per identity, in first-seen order
+        identity_of = {name: i for i, name in enumerate(self.names)}
+        member_identity = np.array([identity_of[name] for name in names], dtype=int)
+        order = np.argsort(member_identity, kind='stable')
+
+        # Members stored contiguously per identity; offsets[i]:offsets[i + 1] are identity i's
+        self.members = self._prepare(embeddings[order])
+        self.member_sq_norms = np.einsum('ij,ij->i', self.members, self.members)
+        counts = np.bincount(member_identity, minlength=len(self.names))
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+        self.index = IVFIndex(dim, metric=metric)
+        if len(self.names):
+            centroids = np.add.reduceat(self.members, self.offsets[:-1], axis=0) / counts[:, None]
+            self.index.build(centroids)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prepare(self, vectors):
+        if self.metric == "cosine":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def search(self, embeddings, k=1):
+        """
+        :param embeddings: (F, dim) probe embeddings.
+        :return: (names, distances): per probe a list of up to k identity names and a
+            (F, k) array of their distances, best first; missing entries are inf.
+        """
+        probes = self._prepare(np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim))
+        distances = np.full((len(probes), k), np.inf, dtype=np.float32)
+        names = [[] for _ in range(len(probes))]
+        if not len(self.names) or not len(probes):
+            return names, distances
+
+        shortlist, _ = self.index.search(probes, max(k, min(self.shortlist, len(self.names))))
+        for f, candidates in enumerate(shortlist):
+            candidates = candidates[candidates >= 0]
+            starts, ends = self.offsets[candidates], self.offsets[candidates + 1]
+            rows = np.concatenate([np.arange(s, e) for s, e in zip(starts.tolist(), ends.tolist())])
+
+            # Exact distances to every member of the shortlisted identities
+            dots = self.members[rows] @ probes[f]
+            if self.metric == "cosine":
+                member_distances = 1.0 - dots
+            else:
+                sq = self.member_sq_norms[rows] - 2.0 * dots + probes[f] @ probes[f]
+                member_distances = np.sqrt(np.maximum(sq, 0.0))
+
+            # Closest member per identity; rows are grouped by identity
+            group_starts = np.concatenate(([0], np.cumsum(ends - starts)[:-1]))
+            identity_distances = np.minimum.reduceat(member_distances, group_starts)
+            best = np.argsort(identity_distances)[:k]
+            names[f] = [self.names[i] for i in candidates[best].tolist()]
+            distances[f, :len(best)] = identity_distances[best]
+        return names, distances
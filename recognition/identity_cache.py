@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+
+
+def box_iou(a, b):
+    """Intersection over union of two (left, top, right, bottom) boxes."""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class _Identity:
+    def __init__(self, name, distance, box, thumb, verified_at):
+        self.name = name
+        self.distance = distance
+        self.box = box
+        self.thumb = thumb
+        self.verified_at = verified_at
+
+
+class IdentityCache:
+    def __init__(self, reverify_interval=2.0, uncertain_interval=0.25, confident_distance=0.5,
+                 min_iou=0.3, appearance_threshold=20.0, thumb_size=(16, 16)):
+        """
+        Remembers who each face track is, so the face encoder only runs for new
+        tracks and for the occasional re-check instead of for every face every frame.
+        A cached identity is checked again when:
+        - reverify_interval seconds have passed since the last recognition,
+        - the last match was weak (distance above confident_distance) and
+          uncertain_interval seconds have passed,
+        - the track's box overlaps its box from the previous frame by less than
+          min_iou, i.e. the track may have jumped to another face,
+        - the face crop looks clearly different from when it was recognized
+          (mean grey level change above appearance_threshold).
+        """
+        self.reverify_interval = reverify_interval
+        self.uncertain_interval = uncertain_interval
+        self.confident_distance = confident_distance
+        self.min_iou = min_iou
+        self.appearance_threshold = appearance_threshold
+        self.thumb_size = thumb_size
+        self.identities = {}  # track id -> _Identity
+        self.recognitions = 0
+        self.reuses = 0
+
+    def _thumb(self, frame, box):
+        left, top, right, bottom = box
+        height, width = frame.shape[:2]
+        crop = frame[max(0, top):min(height, bottom), max(0, left):min(width, right)]
+        if crop.size == 0:
+            return None
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        return cv2.resize(gray, self.thumb_size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def needs_recognition(self, track_id, box, frame, now):
+        """
+        True if the face of track_id in box has to go through the encoder this frame.
+        Updates the track's last box either way.
+        """
+        identity = self.identities.get(track_id)
+        if identity is None or track_id < 0:
+            return True
+        previous_box, identity.box = identity.box, box
+        age = now - identity.verified_at
+        if age >= self.reverify_interval:
+            return True
+        if identity.distance > self.confident_distance and age >= self.uncertain_interval:
+            return True
+        if box_iou(previous_box, box) < self.min_iou:
+            return True
+        thumb = self._thumb(frame, box)
+        if thumb is None or identity.thumb is None:
+            return True
+        if np.abs(thumb - identity.thumb).mean() > self.appearance_threshold:
+            return True
+        self.reuses += 1
+        return False
+
+    def update(self, track_id, box, frame, name, distance, now):
+        """Stores a fresh recognition result for a track."""
+        self.recognitions += 1
+        if track_id < 0:
+            return
+        self.identities[track_id] = _Identity(name, distance, box, self._thumb(frame, box), now)
+
+    def name(self, track_id, default="Unknown"):
+        identity = self.identities.get(track_id)
+        return identity.name if identity is not None else default
+
+    def clear(self):
+        """Forgets every identity, e.g. after the gallery changed."""
+        self.identities.clear()
+
+    def prune(self, active_ids):
+        """Forgets tracks that no longer exist."""
+        active = set(active_ids)
+        for track_id in list(self.identities):
+            if track_id not in active:
+                del self.identities[track_id]
@@ -0,0 +1,170 @@
+"""
+Face encoding off the tracking loop.
+
+The tracker hands padded face crops (tagged with frame and track IDs) to worker
+processes and keeps running on detection alone. Workers only run the 128-d dlib
+encoder; the encodings come back through a queue and are matched against the
+current gallery in the tracker's process, so a gallery reload needs no worker
+restart.
+
+    worker = RecognitionWorker().start()
+    worker.submit(seq, track_ids, boxes, crops, timestamp)
+    for result in worker.poll(sfr):
+        print(result.track_id, result.name, result.latency)
+"""
+import multiprocessing as mp
+import queue
+import time
+from collections import namedtuple
+
+QUEUE_TIMEOUT = 0.1
+
+# One identity arriving for a track; latency is seconds from frame capture to result
+RecognitionResult = namedtuple("RecognitionResult",
+                               ["frame_id", "track_id", "box", "name", "distance", "latency"])
+
+
+def _encode_stage(requests, results, stop_event):
+    # Imported here so only the worker processes load dlib
+    import face_recognition
+
+    while not stop_event.is_set():
+        try:
+            job_id, crops = requests.get(timeout=QUEUE_TIMEOUT)
+        except queue.Empty:
+            continue
+        start = time.perf_counter()
+        encodings = []
+        for crop, location in crops:
+            found = face_recognition.face_encodings(crop, [location])
+            encodings.append(found[0] if found else None)
+        results.put((job_id, encodings, time.perf_counter() - start))
+
+
+class RecognitionWorker:
+    def __init__(self, workers=1, max_pending=4, timeout=5.0, latency_smoothing=0.2):
+        """
+        :param workers: Encoder processes.
+        :param max_pending: Jobs waiting or being encoded at most; submit refuses more,
+            so the queue never grows beyond what the workers keep up with.
+        :param timeout: Seconds after which a job without result is given up, so its
+            tracks can be submitted again.
+        :param latency_smoothing: Weight of the newest sample in the latency averages.
+        """
+        # Spawned workers start clean, without the eventlet patches of the server process
+        self.ctx = mp.get_context("spawn")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.latency_smoothing = latency_smoothing
+        self.requests = self.ctx.Queue(max_pending)
+        self.results = self.ctx.Queue()
+        self.stop_event = self.ctx.Event()
+        self.processes = []
+
+        self.next_job = 0
+        self.jobs = {}  # job id -> (frame id, track ids, boxes, frame timestamp, submitted)
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.latency = None  # Smoothed seconds from frame capture to result
+        self.encode_time = None  # Smoothed seconds a worker spends per job
+
+    def start(self):
+        """Launches the encoder processes. Returns self so it can be chained."""
+        for i in range(self.workers):
+            process = self.ctx.Process(target=_encode_stage, args=(self.requests, self.results, self.stop_event),
+                                       name=f"recognition-{i}", daemon=True)
+            process.start()
+            self.processes.append(process)
+        return self
+
+    @property
+    def queue_depth(self):
+        """Jobs submitted and not answered yet."""
+        return len(self.jobs)
+
+    def in_flight(self, track_id):
+        """True if a face of track_id is waiting for its identity."""
+        return any(track_id in job[1] for job in self.jobs.values())
+
+    def submit(self, frame_id, track_ids, boxes, crops, timestamp):
+        """
+        Queues faces of one frame for encoding without waiting.
+        :param crops: (RGB crop, (top, right, bottom, left) face location inside the crop) per face.
+        :param timestamp: Capture time of the frame, latency is measured from it.
+        :return: False if the workers are saturated and nothing was queued.
+        """
+        if len(self.jobs) >= self.max_pending:
+            self.rejected += 1
+            return False
+        job_id = self.next_job
+        try:
+            self.requests.put_nowait((job_id, crops))
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.next_job += 1
+        self.jobs[job_id] = (frame_id, list(track_ids), list(boxes), timestamp, time.time())
+        self.submitted += 1
+        return True
+
+    def _smooth(self, average, sample):
+        if average is None:
+            return sample
+        return average + self.latency_smoothing * (sample - average)
+
+    def poll(self, sfr):
+        """
+        Collects every finished job without blocking and names its faces.
+        :param sfr: SimpleFacerec whose current gallery and tolerance are used for matching.
+        :return: List of RecognitionResult.
+        """
+        now = time.time()
+        finished = []
+        while True:
+            try:
+                job_id, encodings, encode_time = self.results.get_nowait()
+            except queue.Empty:
+                break
+            job = self.jobs.pop(job_id, None)
+            if job is not None:
+                finished.append((job, encodings))
+                self.encode_time = self._smooth(self.encode_time, encode_time)
+
+        for job_id in [j for j, job in self.jobs.items() if now - job[4] > self.timeout]:
+            del self.jobs[job_id]  # Lost or stuck; let the tracks be submitted again
+            self.expired += 1
+
+        results = []
+        for (frame_id, track_ids, boxes, timestamp, _), encodings in finished:
+            names, distances = sfr.name_encodings([e for e in encodings if e is not None])
+            matched = iter(zip(names, distances))
+            latency = now - timestamp
+            self.latency = self._smooth(self.latency, latency)
+            self.completed += 1
+            for track_id, box, encoding in zip(track_ids, boxes, encodings):
+                name, distance = next(matched) if encoding is not None else ("Unknown", float('inf'))
+                results.append(RecognitionResult(frame_id, track_id, box, name, distance, latency))
+        return results
+
+    def status(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "latency_ms": None if self.latency is None else round(self.latency * 1000.0, 1),
+            "encode_ms": None if self.encode_time is None else round(self.encode_time * 1000.0, 1),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+        }
+
+    def stop(self):
+        """Stops the encoder processes."""
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
@@ -1,17 +1,58 @@
 import RPi.GPIO as GPIO
 import time
-import threading
+
+from servo.motion_profile import TrapezoidalProfile
+
+# The video servers call eventlet.monkey_patch(); the actuation loop has to keep
+# PWM timing while the hub is busy, so always use a real OS thread.
+try:
+    from eventlet.patcher import original as _original
+    threading = _original("threading")
+except ImportError:
+    import threading
 
 class LimitedServoController:
-    def __init__(self, pin, initial_angle=90):
+    def __init__(self, pin, initial_angle=90, min_angle=0, max_angle=180, slew_rate=360.0, hold_time=0.1,
+                 max_velocity=120.0, max_acceleration=600.0, update_rate=50):
         """
         Initializes a servo motor on the given GPIO pin.
+        Targets go into a one-slot mailbox read by an actuation thread: a newer target
+        replaces one that has not been applied yet, and the thread switches the PWM to
+        it within one PWM period. The pulse is held until the servo should have
+        arrived and then released to stop jitter. Slews (slew_to) follow a trapezoidal
+        velocity profile; the same thread steps the duty cycle along it at update_rate.
         :param pin: GPIO pin connected to the servo.
         :param initial_angle: The starting position of the servo.
+        :param min_angle: Smallest angle the servo is driven to; targets are clamped.
+        :param max_angle: Largest angle the servo is driven to.
+        :param slew_rate: Assumed servo speed in degrees per second, used for the
+            position estimate and how long the pulse is held.
+        :param hold_time: Seconds the pulse is kept on after the servo should have arrived.
+        :param max_velocity: Default speed limit of slews in degrees per second.
+        :param max_acceleration: Default acceleration limit of slews in degrees per second squared.
+        :param update_rate: Duty cycle updates per second during a slew; one per PWM period by default.
         """
         self.pin = pin
-        self.current_angle = initial_angle
-        self.lock = threading.Lock()
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        self.slew_rate = slew_rate
+        self.hold_time = hold_time
+        self.max_velocity = max_velocity
+        self.max_acceleration = max_acceleration
+        self.update_interval = 1 / update_rate
+
+        self.current_angle = initial_angle  # Latest commanded angle
+        self.condition = threading.Condition()
+        self.pending = None  # Mailbox: newest (target, slew limits or None) the thread has not applied yet
+        self.profile = None  # TrapezoidalProfile of the slew in progress
+        self.move_start = time.time()
+        self.move_from = initial_angle
+        self.move_to = initial_angle
+        self.release_at = None  # When the pulse of the current move is switched off
+        self.settled = False
+        self.commands = 0
+        self.coalesced = 0  # Targets replaced by a newer one before they were applied
+        self.clamped = 0
 
         # GPIO setup
         GPIO.setmode(GPIO.BCM)
@@ -21,59 +62,151 @@ class LimitedServoController:
         self.pwm = GPIO.PWM(self.pin, 50)
         self.pwm.start(0)
 
+        self.running = True
+        self.thread = threading.Thread(target=self._actuation_loop, name=f"servo-{pin}", daemon=True)
+        self.thread.start()
+
         # Move to the initial angle
-        self.set_angle(self.current_angle)
+        self.set_target(self.current_angle)
+
+    @staticmethod
+    def duty_cycle(angle):
+        """PWM duty cycle in percent for an angle between 0 and 180 degrees."""
+        return (angle / 180) * (12.5 - 2.5) + 2.5
+
+    def set_target(self, angle):
+        """
+        Moves the servo towards angle at full speed without waiting. Safe to call from
+        any thread. Angles outside [min_angle, max_angle] are clamped.
+        :return: The angle that was commanded.
+        """
+        return self._command(angle, None)
+
+    def slew_to(self, angle, max_velocity=None, max_acceleration=None):
+        """
+        Moves the servo to angle along a trapezoidal velocity profile without waiting.
+        A slew or target already in progress is pre-empted smoothly from the current
+        position and velocity.
+        :param max_velocity: Degrees per second, defaults to the controller's.
+        :param max_acceleration: Degrees per second squared, defaults to the controller's.
+        :return: The angle that was commanded.
+        """
+        limits = (max_velocity or self.max_velocity, max_acceleration or self.max_acceleration)
+        return self._command(angle, limits)
+
+    def stop(self, max_acceleration=None):
+        """Brakes a slew in progress to a standstill and holds there."""
+        with self.condition:
+            position, velocity = self._state(time.time())
+        a = max_acceleration or self.max_acceleration
+        stopping = velocity * abs(velocity) / (2 * a)
+        return self._command(position + stopping, (self.max_velocity, a))
+
+    def _command(self, angle, limits):
+        if not self.min_angle <= angle <= self.max_angle:
+            clamped = min(max(angle, self.min_angle), self.max_angle)
+            print(f"Servo {self.pin}: target {angle} clamped to {clamped}")
+            self.clamped += 1
+            angle = clamped
+        with self.condition:
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = (angle, limits)
+            self.current_angle = angle
+            self.settled = False
+            self.commands += 1
+            self.condition.notify_all()
+        return angle
 
     def set_angle(self, angle):
         """
-        Moves the servo to a specified angle.
+        Moves the servo to a specified angle. Kept for existing callers; returns
+        immediately like set_target, use wait_settled to block until it arrived.
         :param angle: Target angle between 0 and 180 degrees.
         """
-        if not 0 <= angle <= 180:
-            print("negative", angle)
-            return
-        acquired = self.lock.acquire(blocking=False)
-
-        print("setting_angle")
-        if acquired:
-            try:
-                print("acquired and running")
-                """
-                time.sleep(1)
-                """
-                duty_cycle = (angle / 180) * (12.5 - 2.5) + 2.5
-                self.pwm.ChangeDutyCycle(duty_cycle)
-                time.sleep(0.5)  # Adjust time based on servo speed
-                self.pwm.ChangeDutyCycle(0)  # Stop sending signal to reduce jitter
-
-                self.current_angle = angle  # Store current position
-            finally:
-                print("released")
-                self.lock.release()
-        else:
-            print("skipped")
-        print()
+        self.set_target(angle)
+
+    def _state(self, now):
+        """
+        Estimated (angle, velocity) at now. Call with the condition held.
+        A set_target move is a step the servo makes on its own, so it is planned
+        from with zero velocity: its slew_rate is only an upper bound for how long
+        the pulse is held, not a speed the servo keeps up.
+        """
+        if self.profile is not None:
+            position, velocity = self.profile.state(now)
+            return min(max(position, self.min_angle), self.max_angle), velocity
+        travel = abs(self.move_to - self.move_from)
+        if travel == 0:
+            return self.move_to, 0.0
+        progress = min(1.0, (now - self.move_start) * self.slew_rate / travel)
+        return self.move_from + (self.move_to - self.move_from) * progress, 0.0
+
+    def current_estimate(self):
+        """Estimated angle right now, following the slew profile or assuming full speed at slew_rate."""
+        with self.condition:
+            return self._state(time.time())[0]
+
+    def wait_settled(self, timeout=None):
+        """
+        Blocks until the latest target has been reached and the pulse released.
+        :return: False if timeout seconds passed first.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.settled or not self.running, timeout)
+
+    def _actuation_loop(self):
+        with self.condition:
+            while self.running:
+                now = time.time()
+                if self.pending is not None:
+                    # Start the newest move from wherever the servo is estimated to be now
+                    (target, limits), self.pending = self.pending, None
+                    position, velocity = self._state(now)
+                    self.move_from, self.move_to, self.move_start = position, target, now
+                    if limits is None:
+                        self.profile = None
+                        self.release_at = now + abs(target - position) / self.slew_rate + self.hold_time
+                        self.pwm.ChangeDutyCycle(self.duty_cycle(target))
+                    else:
+                        self.profile = TrapezoidalProfile(position, target, *limits, velocity, now)
+                        self.release_at = self.profile.end_time + self.hold_time
+                if self.profile is not None and now <= self.profile.end_time + self.update_interval:
+                    # One step along the slew per update interval, ending exactly on the target.
+                    # A pre-empted profile may brake past a limit, the servo never does
+                    position = min(max(self.profile.position(now), self.min_angle), self.max_angle)
+                    self.pwm.ChangeDutyCycle(self.duty_cycle(position))
+                elif self.release_at is not None and now >= self.release_at:
+                    self.pwm.ChangeDutyCycle(0)  # Stop sending signal to reduce jitter
+                    self.profile = None
+                    self.release_at = None
+                    self.settled = True
+                    self.condition.notify_all()
+
+                timeout = None if self.release_at is None else max(0.0, self.release_at - time.time())
+                if self.profile is not None and now <= self.profile.end_time:
+                    timeout = min(timeout, self.update_interval)
+                if self.pending is None:
+                    self.condition.wait(timeout)
 
     def move_slowly(self, target_angle, step=1, delay=0.05):
         """
         Gradually moves the servo from the current angle to the target angle.
+        Kept for existing callers: a slew_to with a top speed of step degrees per
+        delay seconds, which returns immediately.
         :param target_angle: The desired angle to move to.
         :param step: The increment for each movement step.
         :param delay: Delay between each step for smooth movement.
         """
-        if self.current_angle < target_angle:
-            for angle in range(self.current_angle, target_angle + 1, step):
-                self.set_angle(angle)
-                time.sleep(delay)
-        else:
-            for angle in range(self.current_angle, target_angle - 1, -step):
-                self.set_angle(angle)
-                time.sleep(delay)
-
-        self.current_angle = target_angle  # Update stored angle
+        return self.slew_to(target_angle, max_velocity=step / delay)
 
     def cleanup(self):
-        """Stops the PWM and cleans up GPIO."""
+        """Stops the actuation thread and the PWM and cleans up GPIO."""
+        if self.running:
+            with self.condition:
+                self.running = False
+                self.condition.notify_all()
+            self.thread.join(timeout=1.0)
         self.pwm.stop()
         GPIO.cleanup()
 
@@ -0,0 +1,84 @@
+import math
+
+
+class TrapezoidalProfile:
+    def __init__(self, start, target, max_velocity, max_acceleration, start_velocity=0.0, start_time=0.0):
+        """
+        Time-parameterised move from start to target that accelerates at most at
+        max_acceleration, cruises at no more than max_velocity and comes to rest on
+        the target. A move that is already under way (start_velocity) is continued
+        smoothly: if it heads away from the target or is too fast to stop in time it
+        brakes first and then turns around, so a new target can pre-empt a slew.
+        :param start: Position at start_time.
+        :param target: Position to come to rest at.
+        :param max_velocity: Speed limit, units per second.
+        :param max_acceleration: Acceleration limit, units per second squared.
+        :param start_velocity: Velocity at start_time.
+        :param start_time: Time the profile starts at, e.g. time.time().
+        """
+        self.start = start
+        self.target = target
+        self.max_velocity = max_velocity
+        self.max_acceleration = max_acceleration
+        self.start_time = start_time
+        self.segments = []  # (start time, position, velocity, acceleration, duration)
+        self._plan(start, start_velocity, start_time)
+        last = self.segments[-1] if self.segments else None
+        self.end_time = last[0] + last[4] if last else start_time
+
+    def _add(self, t, position, velocity, acceleration, duration):
+        if duration > 0:
+            self.segments.append((t, position, velocity, acceleration, duration))
+        end_position = position + velocity * duration + 0.5 * acceleration * duration ** 2
+        return t + duration, end_position, velocity + acceleration * duration
+
+    def _plan(self, position, velocity, t):
+        a = self.max_acceleration
+        distance = self.target - position
+        direction = math.copysign(1.0, distance) if distance else math.copysign(1.0, velocity)
+        v = velocity * direction  # Velocity towards the target
+        if v < 0 or v * v / (2 * a) > abs(distance) + 1e-9:
+            # Heading away or cannot stop in time: brake to rest, then plan again from there
+            t, position, _ = self._add(t, position, velocity, -math.copysign(a, velocity), abs(velocity) / a)
+            distance = self.target - position
+            if abs(distance) < 1e-9:
+                return
+            direction = math.copysign(1.0, distance)
+            v = 0.0
+        distance = abs(distance)
+        if distance < 1e-9:
+            return
+
+        # Accelerate (or slow down) to the peak speed, cruise, then brake onto the target
+        peak = min(self.max_velocity, math.sqrt(a * distance + v * v / 2))
+        t1 = abs(peak - v) / a
+        d1 = (peak + v) / 2 * t1
+        t3 = peak / a
+        d3 = peak * peak / (2 * a)
+        t2 = max(0.0, distance - d1 - d3) / peak if peak > 0 else 0.0
+        t, position, _ = self._add(t, position, v * direction, math.copysign(a, peak - v) * direction, t1)
+        t, position, _ = self._add(t, position, peak * direction, 0.0, t2)
+        self._add(t, position, peak * direction, -a * direction, t3)
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+
+    def done(self, t):
+        return t >= self.end_time
+
+    def state(self, t):
+        """(position, velocity) at time t; before the start the start state, after the end the target at rest."""
+        if not self.segments or t >= self.end_time:
+            return self.target, 0.0
+        for start, position, velocity, acceleration, duration in self.segments:
+            if t < start + duration:
+                dt = max(0.0, t - start)
+                return position + velocity * dt + 0.5 * acceleration * dt * dt, velocity + acceleration * dt
+        return self.target, 0.0
+
+    def position(self, t):
+        return self.state(t)[0]
+
+    def velocity(self, t):
+        return self.state(t)[1]
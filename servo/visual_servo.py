@@ -0,0 +1,238 @@
+"""
+Closed-loop aiming of the pan/tilt turret.
+
+The tracker reports, once per frame, where the target is relative to the image
+centre and how fast it moves across the image, both in pixels. A control thread
+turns that into angles and runs a PID loop with velocity feed-forward per axis
+at a fixed rate, between frames as well: the measurement is carried forward to
+the current time using the target's velocity and how far the turret has turned
+since the frame was captured.
+
+    controller = VisualServoController(motorX, motorY).start()
+    controller.update(TrackingError(timestamp, (dx, dy), (vx, vy), (width, height), False))
+"""
+import bisect
+import math
+import time
+from collections import deque, namedtuple
+
+# Real OS thread: the control rate has to hold while the eventlet hub is busy
+try:
+    from eventlet.patcher import original as _original
+    threading = _original("threading")
+except ImportError:
+    import threading
+
+# What the tracker measured in one frame. error is target minus image centre and
+# velocity the target's image velocity, in pixels and pixels per second; size is
+# the frame (width, height) they refer to.
+TrackingError = namedtuple("TrackingError", ["timestamp", "error", "velocity", "size", "on_target"])
+
+
+def pixels_to_degrees(pixels, extent, fov):
+    """Angle from the optical axis of a point pixels from the image centre, for a pinhole camera."""
+    focal = (extent / 2) / math.tan(math.radians(fov / 2))
+    return math.degrees(math.atan(pixels / focal))
+
+
+def pixel_rate_to_degrees(pixels, rate, extent, fov):
+    """Angular velocity in degrees per second of a point moving rate pixels per second at pixels from the centre."""
+    focal = (extent / 2) / math.tan(math.radians(fov / 2))
+    return math.degrees(rate * focal / (focal * focal + pixels * pixels))
+
+
+class PIDAxis:
+    def __init__(self, kp=4.0, ki=1.0, kd=0.05, feedforward=1.0, deadband=0.5, integral_limit=5.0,
+                 max_rate=180.0):
+        """
+        PID controller for one turret axis. Its output is a turn rate in degrees per second.
+        :param kp: Degrees per second per degree of error.
+        :param ki: Degrees per second per degree-second of accumulated error.
+        :param kd: Degrees per second per degree per second of error change.
+        :param feedforward: Share of the target's own angular velocity passed straight through.
+        :param deadband: Errors smaller than this many degrees count as zero and are not integrated.
+        :param integral_limit: Largest magnitude of the accumulated error in degree-seconds.
+        :param max_rate: Output limit in degrees per second.
+        """
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.feedforward = feedforward
+        self.deadband = deadband
+        self.integral_limit = integral_limit
+        self.max_rate = max_rate
+        self.integral = 0.0
+
+    def reset(self):
+        self.integral = 0.0
+
+    def update(self, error, error_rate, target_rate, dt, at_limit=0):
+        """
+        :param error: Target angle minus turret angle in degrees.
+        :param error_rate: How fast the error changes, degrees per second.
+        :param target_rate: The target's own angular velocity, degrees per second.
+        :param dt: Seconds since the last update.
+        :param at_limit: +1 or -1 if the turret is at its upper or lower angle limit, else 0.
+        :return: Commanded turn rate in degrees per second.
+        """
+        if abs(error) < self.deadband:
+            error = 0.0
+        unclamped = (self.feedforward * target_rate + self.kp * error + self.ki * self.integral
+                     + self.kd * error_rate)
+        output = max(-self.max_rate, min(self.max_rate, unclamped))
+
+        # Anti-windup: stop integrating while the output or the turret is saturated
+        # in the direction the error pushes
+        pushing = math.copysign(1, error)
+        saturated = (output != unclamped and math.copysign(1, unclamped) == pushing) or at_limit == pushing
+        if error and not saturated:
+            self.integral = max(-self.integral_limit, min(self.integral_limit, self.integral + error * dt))
+        return output
+
+
+class VisualServoController:
+    # PIDAxis attributes set_gains may change
+    GAINS = ("kp", "ki", "kd", "feedforward", "deadband", "integral_limit", "max_rate")
+
+    def __init__(self, pan, tilt, fov=(58.5, 45.6), rate=50, timeout=0.5, min_step=0.25,
+                 pan_sign=1, tilt_sign=-1, pan_gains=None, tilt_gains=None):
+        """
+        :param pan: Servo for the horizontal axis, a LimitedServoController.
+        :param tilt: Servo for the vertical axis.
+        :param fov: Horizontal and vertical field of view of the camera in degrees.
+        :param rate: Control updates per second; one per PWM period by default.
+        :param timeout: Seconds without a new measurement after which the turret holds still.
+        :param min_step: Smallest change in degrees sent to a servo, so it is not re-pulsed
+            for nothing while on target.
+        :param pan_sign: Servo angle change per degree of target right of centre.
+        :param tilt_sign: Servo angle change per degree of target below centre.
+        :param pan_gains: Keyword arguments for the pan PIDAxis.
+        :param tilt_gains: Keyword arguments for the tilt PIDAxis.
+        """
+        self.servos = (pan, tilt)
+        self.fov = fov
+        self.interval = 1 / rate
+        self.timeout = timeout
+        self.min_step = min_step
+        self.signs = (pan_sign, tilt_sign)
+        self.axes = (PIDAxis(**(pan_gains or {})), PIDAxis(**(tilt_gains or {})))
+
+        self.lock = threading.Lock()
+        self.measurement = None  # Newest TrackingError
+        self.commands = [float(pan.current_angle), float(tilt.current_angle)]
+        self.history = deque(maxlen=int(rate * 2))  # (time, pan estimate, tilt estimate)
+        self.last_errors = (0.0, 0.0)
+        self.updates = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Starts the control thread. Returns self so it can be chained."""
+        self.running = True
+        self.thread = threading.Thread(target=self._control_loop, name="visual-servo", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+    def update(self, measurement):
+        """Hands the newest TrackingError to the control loop. Safe to call from any thread."""
+        with self.lock:
+            self.measurement = measurement
+            self.updates += 1
+
+    def set_gains(self, axis=None, **gains):
+        """
+        Changes controller gains while running, e.g. set_gains(kp=3.0) or set_gains("tilt", kd=0.1).
+        :param axis: "pan", "tilt", or None for both.
+        :param gains: PIDAxis attributes to set.
+        """
+        names = ("pan", "tilt")
+        if axis is not None and axis not in names:
+            raise ValueError(f"Unknown axis {axis}")
+        # Check everything first so a bad value leaves the gains untouched
+        checked = {}
+        for key, value in gains.items():
+            if key not in self.GAINS:
+                raise ValueError(f"Unknown gain {key}")
+            value = float(value)
+            if not math.isfinite(value) or value < 0:
+                raise ValueError(f"Gain {key} must be a finite number >= 0, got {value}")
+            checked[key] = value
+        with self.lock:
+            for name, pid in zip(names, self.axes):
+                if axis is None or axis == name:
+                    for key, value in checked.items():
+                        setattr(pid, key, value)
+
+    def status(self):
+        with self.lock:
+            return {
+                name: dict({key: getattr(pid, key) for key in self.GAINS},
+                           integral=round(pid.integral, 3), error=round(error, 2), command=round(command, 2))
+                for name, pid, error, command in zip(("pan", "tilt"), self.axes, self.last_errors, self.commands)
+            }
+
+    def _turret_at(self, timestamp):
+        """(pan, tilt) estimates at timestamp and the rates they were changing at, from the history."""
+        history = list(self.history)
+        if len(history) < 2:
+            return history[-1][1:], (0.0, 0.0)
+        i = bisect.bisect_right([entry[0] for entry in history], timestamp) - 1
+        before, after = history[min(max(i, 0), len(history) - 2):][:2]
+        dt = after[0] - before[0]
+        share = min(1.0, max(0.0, (timestamp - before[0]) / dt))
+        angles = tuple(b + (a - b) * share for b, a in zip(before[1:], after[1:]))
+        rates = tuple((a - b) / dt for b, a in zip(before[1:], after[1:]))
+        return angles, rates
+
+    def _control_loop(self):
+        last = time.time()
+        while self.running:
+            time.sleep(max(0.0, last + self.interval - time.time()))
+            now = time.time()
+            dt, last = now - last, now
+            turret = tuple(servo.current_estimate() for servo in self.servos)
+            self.history.append((now,) + turret)
+            with self.lock:
+                self._step(now, dt, turret)
+
+    def _step(self, now, dt, turret):
+        measurement = self.measurement
+        if measurement is None or now - measurement.timestamp > self.timeout:
+            # Target lost: hold where we are and forget the accumulated error
+            for pid in self.axes:
+                pid.reset()
+            # Pick up from wherever anything else moved the servos meanwhile
+            self.commands = [float(servo.current_angle) for servo in self.servos]
+            return
+
+        age = now - measurement.timestamp
+        turret_then, turret_rate_then = self._turret_at(measurement.timestamp)
+        turret_rate = self._turret_at(now)[1]
+        errors = []
+        for i, (servo, pid, sign, fov) in enumerate(zip(self.servos, self.axes, self.signs, self.fov)):
+            pixels, pixel_rate, extent = measurement.error[i], measurement.velocity[i], measurement.size[i]
+            # Measured error and its rate, as servo angles
+            error_then = sign * pixels_to_degrees(pixels, extent, fov)
+            image_rate = sign * pixel_rate_to_degrees(pixels, pixel_rate, extent, fov)
+            # The camera turns with the turret, so the target's own rate is the image rate plus the turret's
+            target_rate = image_rate + turret_rate_then[i]
+            # Carry the target forward to now and compare with where the turret is now
+            error = turret_then[i] + error_then + target_rate * age - turret[i]
+            error_rate = target_rate - turret_rate[i]
+            errors.append(error)
+
+            at_limit = 0
+            if self.commands[i] >= servo.max_angle:
+                at_limit = 1
+            elif self.commands[i] <= servo.min_angle:
+                at_limit = -1
+            output = pid.update(error, error_rate, target_rate, dt, at_limit)
+            self.commands[i] = max(servo.min_angle, min(servo.max_angle, self.commands[i] + output * dt))
+            if abs(self.commands[i] - servo.current_angle) >= self.min_step:
+                servo.set_target(self.commands[i])
+        self.last_errors = tuple(errors)
@@ -2,57 +2,192 @@ import face_recognition
 import cv2
 import numpy as np
 import os
+from recognition.detection_scale import DetectionScalePolicy, FrameScaler
+from recognition.encoding_cache import EncodingCache
+from recognition.enroll import enroll
+from recognition.identities import IdentityGallery, identity_names, load_manifest
+
+# Cache file written next to the gallery images; the leading dot keeps it out of the listing.
+# Same file as RecognitionEngine's face_recognition backend, so recognition.enroll fills it
+ENCODING_CACHE_FILE = ".face_recognition_encodings.npz"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
 
 class SimpleFacerec:
     def __init__(self):
         self.known_face_encodings = []
         self.known_face_names = []
-        self.frame_resizing = 0.25  # Resize frame for faster processing
+        self.frame_resizing = 0.25  # Scale the last frame was detected at, picked per frame by scale_policy
+        # dlib's HOG detector (upsampled once) finds faces of about 40 pixels; faces of
+        # 80 pixels in the full frame are the farthest ones we still engage
+        self.scale_policy = DetectionScalePolicy(detector_min_face=40, min_face=80)
+        self.scaler = FrameScaler(cv2.COLOR_BGR2RGB)
+        self.tolerance = 0.6  # Largest distance that still counts as a match (face_recognition default)
+        self.top_k = 3
+
+        # Known faces grouped per person, replaced as a whole whenever images are loaded.
+        # "gerald.jpg" and "gerald1.jpg" are one identity: probes are compared with each
+        # person's centroid and only the closest people's images are checked exactly
+        self.gallery = IdentityGallery(128, "l2")
+        self.last_matches = []  # Per face of the last frame: [(name, distance), ...] best first
+        self.rgb_small_frame = None
+        self.small_face_locations = []
 
-    def load_encoding_images(self, images_path):
+    def load_encoding_images(self, images_path, use_cache=True, workers=0):
         """
         Load face encodings from images in a directory.
+        Images of the same person share a name apart from a trailing number
+        ("gerald.jpg", "gerald1.jpg"), or are listed together in the directory's manifest.json.
+        Encodings are cached in the directory, so only new or changed images are
+        encoded again and deleted ones are dropped from the cache.
+        :param workers: If set, new images are first encoded by that many processes.
         """
-        for file in os.listdir(images_path):
-            if file.startswith('.'):
-                continue
+        names, encodings = self._encode_directory(images_path, use_cache, workers)
+        self.known_face_encodings.extend(encodings)
+        self.known_face_names.extend(names)
+        self.build_gallery()
+
+    def reload_encoding_images(self, images_path, use_cache=True):
+        """
+        Replaces the known faces with the images currently in a directory. Only new
+        or changed images are encoded; the new gallery is swapped in in one step,
+        so it is safe to call from another thread while frames are being recognized.
+        """
+        names, encodings = self._encode_directory(images_path, use_cache)
+        gallery = IdentityGallery(128, "l2", names, np.asarray(encodings, dtype=np.float32).reshape(-1, 128))
+        self.known_face_encodings, self.known_face_names = encodings, names
+        self.gallery = gallery
+
+    def _encode_directory(self, images_path, use_cache=True, workers=0):
+        """(identity names, encodings) of the images in a directory that contain a face."""
+        if use_cache and workers:
+            enroll(images_path, "face_recognition", workers, os.path.join(images_path, ENCODING_CACHE_FILE))
+        cache = EncodingCache(os.path.join(images_path, ENCODING_CACHE_FILE)) if use_cache else None
+        files = sorted(os.listdir(images_path))
+        identities = identity_names(files, load_manifest(images_path))
+        names, known_encodings = [], []
+        img_paths = []
+        for file in files:
             img_path = os.path.join(images_path, file)
-            img = face_recognition.load_image_file(img_path)
-            encodings = face_recognition.face_encodings(img)
+            if file.startswith('.') or not file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            img_paths.append(img_path)
 
-            if encodings:
-                self.known_face_encodings.append(encodings[0])
-                self.known_face_names.append(os.path.splitext(file)[0])
+            hit, encoding = cache.get(img_path) if cache is not None else (False, None)
+            if not hit:
+                img = face_recognition.load_image_file(img_path)
+                encodings = face_recognition.face_encodings(img)
+                encoding = encodings[0] if encodings else None
+                if cache is not None:
+                    cache.put(img_path, encoding)
+
+            if encoding is not None:
+                known_encodings.append(encoding)
+                names.append(identities[file])
             else:
                 print(f"Warning: No face found in {file}")
 
-    def detect_known_faces(self, frame):
+        if cache is not None:
+            cache.prune(img_paths)
+            cache.save()
+        return names, known_encodings
+
+    def build_gallery(self):
+        """Groups the known encodings by name and indexes one centroid per person."""
+        encodings = np.asarray(self.known_face_encodings, dtype=np.float32).reshape(-1, 128)
+        self.gallery = IdentityGallery(128, "l2", self.known_face_names, encodings)
+
+    def match_encodings(self, face_encodings, k=None, gallery=None):
         """
-        Detect known faces in a given frame.
+        Nearest known people for several faces at once.
+        :param face_encodings: (F, 128) encodings of the detected faces.
+        :param k: Matches returned per face, defaults to top_k.
+        :param gallery: IdentityGallery to search, defaults to the current one.
+        :return: (names, distances): per face a list of k names and a (F, k) array of
+            distances to each person's closest image, sorted best first.
+        """
+        if gallery is None:
+            gallery = self.gallery
+        k = min(self.top_k if k is None else k, len(gallery))
+        faces = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        if k == 0 or not len(faces):
+            return [[] for _ in range(len(faces))], np.zeros((len(faces), 0), dtype=np.float32)
+        return gallery.search(faces, k)
+
+    def detect_faces(self, frame):
+        """
+        Finds faces without recognizing them. recognize_faces can then encode any
+        of them without detecting again. The frame is downscaled as far as the
+        recently seen face sizes allow, see scale_policy.
+        :return: (N, 4) face locations (top, right, bottom, left) in frame pixels.
         """
-        # Resize frame to speed up processing
-        small_frame = cv2.resize(frame, (0, 0), fx=self.frame_resizing, fy=self.frame_resizing)
-        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        return self.scale_policy.run(lambda scale: self._detect_at(frame, scale))
 
-        # Detect face locations and encodings
-        face_locations = face_recognition.face_locations(rgb_small_frame)
-        face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+    def _detect_at(self, frame, scale):
+        # Resize frame to speed up processing; the buffers are reused between frames
+        self.frame_resizing = scale
+        self.rgb_small_frame = self.scaler(frame, scale)
+        self.small_face_locations = face_recognition.face_locations(self.rgb_small_frame)
 
+        # Scale back face locations to match the original frame size
+        face_locations = np.array(self.small_face_locations).reshape(-1, 4)
+        return (face_locations / scale).astype(int)
+
+    def recognize_faces(self, face_indices=None):
+        """
+        Names faces found by the last detect_faces call.
+        :param face_indices: Which of the detected faces to encode; all by default.
+        :return: (names, distances to the best match, inf if the gallery is empty).
+        """
+        if face_indices is None:
+            face_indices = range(len(self.small_face_locations))
+        locations = [self.small_face_locations[i] for i in face_indices]
+        face_encodings = face_recognition.face_encodings(self.rgb_small_frame, locations) if locations else []
+        return self.name_encodings(face_encodings)
+
+    def name_encodings(self, face_encodings):
+        """
+        Names already computed face encodings.
+        :return: (names, distances to the best match, inf if the gallery is empty).
+        """
+        # All faces against the whole gallery in one go. Read it once: a reload may swap it
+        gallery = self.gallery
+        names, distances = self.match_encodings(face_encodings, gallery=gallery)
         face_names = []
-        for face_encoding in face_encodings:
-            matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding)
+        best_distances = []
+        self.last_matches = []
+        for match_names, face_distances in zip(names, distances.tolist()):
+            matches = list(zip(match_names, face_distances))
             name = "Unknown"
-            face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-
-            if face_distances is not None and len(face_distances) > 0:
-                best_match_index = np.argmin(face_distances)
-                if matches[best_match_index]:
-                    name = self.known_face_names[best_match_index]
+            if matches and matches[0][1] <= self.tolerance:
+                name = matches[0][0]
 
             face_names.append(name)
+            best_distances.append(matches[0][1] if matches else float('inf'))
+            self.last_matches.append(matches)
+        return face_names, best_distances
 
-        # Scale back face locations to match the original frame size
-        face_locations = np.array(face_locations)
-        face_locations = (face_locations / self.frame_resizing).astype(int)
+    def face_crops(self, face_indices, margin=0.5):
+        """
+        Crops of faces found by the last detect_faces call, for encoding elsewhere.
+        Each crop is padded by margin times the face size so the landmark model sees
+        the whole face, and copied so it stays valid after the next frame.
+        :return: List of (RGB crop, (top, right, bottom, left) face location inside the crop).
+        """
+        height, width = self.rgb_small_frame.shape[:2]
+        crops = []
+        for i in face_indices:
+            top, right, bottom, left = self.small_face_locations[i]
+            pad_x, pad_y = int((right - left) * margin), int((bottom - top) * margin)
+            x0, y0 = max(0, left - pad_x), max(0, top - pad_y)
+            x1, y1 = min(width, right + pad_x), min(height, bottom + pad_y)
+            crop = self.rgb_small_frame[y0:y1, x0:x1].copy()
+            crops.append((crop, (top - y0, right - x0, bottom - y0, left - x0)))
+        return crops
 
+    def detect_known_faces(self, frame):
+        """
+        Detect known faces in a given frame.
+        """
+        face_locations = self.detect_faces(frame)
+        face_names, _ = self.recognize_faces()
         return face_locations, face_names
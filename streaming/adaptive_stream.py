@@ -0,0 +1,142 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class AdaptiveStreamController:
+    def __init__(self, broadcaster=None, min_quality=30, max_quality=85, min_scale=0.4, max_scale=1.0,
+                 min_fps=5.0, max_fps=20.0, bandwidth_budget=1_500_000, cpu_budget=0.25,
+                 max_lag=0.5, adjust_interval=1.0):
+        """
+        Adjusts JPEG quality, output scale and stream frame rate at runtime so the
+        stream stays inside a bandwidth and CPU budget and viewers keep up.
+        Quality is given up first, then resolution, then frame rate; they come
+        back in the reverse order once there is headroom again.
+        :param broadcaster: StreamBroadcaster whose client stats show delivery throughput.
+        :param bandwidth_budget: Bytes per second the stream may use.
+        :param cpu_budget: Fraction of one core the encoder may use.
+        :param max_lag: Capture-to-delivery lag in seconds above which the slowest
+            viewer counts as congested.
+        :param adjust_interval: Seconds between adjustments.
+        """
+        self.broadcaster = broadcaster
+        self.min_quality, self.max_quality = min_quality, max_quality
+        self.min_scale, self.max_scale = min_scale, max_scale
+        self.min_fps, self.max_fps = min_fps, max_fps
+        self.bandwidth_budget = bandwidth_budget
+        self.cpu_budget = cpu_budget
+        self.max_lag = max_lag
+        self.adjust_interval = adjust_interval
+
+        self.quality = max_quality
+        self.scale = max_scale
+        self.fps = max_fps
+
+        self.encode_time = 0.0  # Seconds per frame, smoothed
+        self.frame_bytes = 0.0  # Bytes per frame, smoothed
+        self.last_adjust = time.time()
+        self.last_frame_time = 0.0
+        self.last_reason = "start"
+        self.resized = None
+
+    def frame_due(self, now=None):
+        """True if enough time has passed since the last streamed frame at the current rate."""
+        now = time.time() if now is None else now
+        if now - self.last_frame_time < 1.0 / self.fps:
+            return False
+        self.last_frame_time = now
+        return True
+
+    def encode(self, frame):
+        """Scales and JPEG-encodes a frame with the current settings. Returns the JPEG bytes or None."""
+        start = time.perf_counter()
+        if self.scale < 1.0:
+            height, width = frame.shape[:2]
+            size = (max(1, int(width * self.scale)), max(1, int(height * self.scale)))
+            if self.resized is None or self.resized.shape[1::-1] != size:
+                self.resized = np.empty((size[1], size[0], frame.shape[2]), dtype=frame.dtype)
+            cv2.resize(frame, size, dst=self.resized, interpolation=cv2.INTER_AREA)
+            frame = self.resized
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+        if not ok:
+            return None
+        jpeg = buffer.tobytes()
+        self.record(time.perf_counter() - start, len(jpeg))
+        return jpeg
+
+    def record(self, encode_seconds, num_bytes):
+        """Feeds one encode measurement; used directly when encoding happens elsewhere."""
+        if self.frame_bytes == 0.0:
+            self.encode_time, self.frame_bytes = encode_seconds, float(num_bytes)
+        else:
+            self.encode_time = 0.9 * self.encode_time + 0.1 * encode_seconds
+            self.frame_bytes = 0.9 * self.frame_bytes + 0.1 * num_bytes
+        if time.time() - self.last_adjust >= self.adjust_interval:
+            self.adjust()
+
+    def slowest_client(self):
+        """(send rate, lag, publish rate) of the viewer that is furthest behind, or None."""
+        if self.broadcaster is None:
+            return None
+        stats = self.broadcaster.stats()
+        clients = [c for c in stats["clients"].values() if c["sent"] > 0]
+        if not clients:
+            return None
+        slowest = max(clients, key=lambda c: c["lag_ms"])
+        return slowest["fps"], slowest["lag_ms"] / 1000.0, stats["fps"]
+
+    def adjust(self):
+        self.last_adjust = time.time()
+        bandwidth = self.frame_bytes * self.fps
+        cpu = self.encode_time * self.fps
+        congested = False
+        slowest = self.slowest_client()
+        if slowest is not None:
+            rate, lag, published = slowest
+            # A viewer can only be as fast as frames are published, e.g. not while the scene is static
+            congested = lag > self.max_lag or rate < 0.7 * min(self.fps, published)
+
+        if bandwidth > self.bandwidth_budget or cpu > self.cpu_budget or congested:
+            self.last_reason = ("bandwidth" if bandwidth > self.bandwidth_budget
+                                else "cpu" if cpu > self.cpu_budget else "congestion")
+            self._step_down(cpu > self.cpu_budget)
+        elif (bandwidth < 0.6 * self.bandwidth_budget and cpu < 0.6 * self.cpu_budget
+              and (slowest is None or slowest[1] < 0.5 * self.max_lag)):
+            self.last_reason = "headroom"
+            self._step_up()
+        else:
+            self.last_reason = "steady"
+
+    def _step_down(self, cpu_bound):
+        # Lower quality barely saves encode time, so go straight to resolution when CPU bound
+        if self.quality > self.min_quality and not cpu_bound:
+            self.quality = max(self.min_quality, self.quality - 10)
+        elif self.scale > self.min_scale:
+            self.scale = max(self.min_scale, round(self.scale * 0.8, 2))
+        elif self.fps > self.min_fps:
+            self.fps = max(self.min_fps, self.fps * 0.8)
+
+    def _step_up(self):
+        if self.fps < self.max_fps:
+            self.fps = min(self.max_fps, self.fps * 1.25)
+        elif self.scale < self.max_scale:
+            self.scale = min(self.max_scale, round(self.scale * 1.25, 2))
+        elif self.quality < self.max_quality:
+            self.quality = min(self.max_quality, self.quality + 5)
+
+    def status(self):
+        return {
+            "quality": int(self.quality),
+            "scale": self.scale,
+            "fps": round(self.fps, 2),
+            "encode_ms": round(self.encode_time * 1000.0, 2),
+            "frame_bytes": int(self.frame_bytes),
+            "bandwidth_bps": int(self.frame_bytes * self.fps),
+            "reason": self.last_reason,
+            "bounds": {
+                "quality": [self.min_quality, self.max_quality],
+                "scale": [self.min_scale, self.max_scale],
+                "fps": [self.min_fps, self.max_fps],
+            },
+        }
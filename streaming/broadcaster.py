@@ -0,0 +1,170 @@
+import threading
+import time
+
+
+class ClientMailbox:
+    def __init__(self, client_id):
+        """
+        One-slot mailbox holding the newest frame not yet delivered to a client.
+        A frame that is replaced before it was sent counts as skipped.
+        """
+        self.client_id = client_id
+        self.frame = None  # (jpeg, seq, timestamp)
+        self.cond = threading.Condition()
+        self.closed = False
+
+        self.connected_at = time.time()
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.bytes_sent = 0
+        self.send_rate = 0.0  # Frames per second, smoothed
+        self.lag = 0.0  # Seconds from capture to delivery of the last frame, smoothed
+        self.last_sent_time = None
+        self.last_sent_seq = -1
+
+    def put(self, frame):
+        with self.cond:
+            if self.frame is not None:
+                self.frames_skipped += 1
+            self.frame = frame
+            self.cond.notify()
+
+    def take(self, timeout=1.0):
+        """Waits for the next frame and removes it from the mailbox. Returns None on timeout or close."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.frame is not None or self.closed, timeout=timeout)
+            frame, self.frame = self.frame, None
+            return None if self.closed else frame
+
+    def delivered(self, frame):
+        """Records that a frame taken from the mailbox reached the client."""
+        jpeg, seq, timestamp = frame
+        now = time.time()
+        self.frames_sent += 1
+        self.bytes_sent += len(jpeg)
+        self.last_sent_seq = seq
+        self.lag = 0.8 * self.lag + 0.2 * (now - timestamp) if self.frames_sent > 1 else now - timestamp
+        if self.last_sent_time is not None:
+            interval = max(now - self.last_sent_time, 1e-6)
+            self.send_rate = 0.8 * self.send_rate + 0.2 / interval
+        self.last_sent_time = now
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self):
+        return {
+            "sent": self.frames_sent,
+            "skipped": self.frames_skipped,
+            "bytes": self.bytes_sent,
+            "fps": round(self.send_rate, 2),
+            "lag_ms": round(self.lag * 1000.0, 1),
+        }
+
+
+class StreamBroadcaster:
+    def __init__(self, socketio, event='video_frame', metadata_event='frame_metadata',
+                 keepalive_event='stream_keepalive', ack_timeout=2.0):
+        """
+        Fans each encoded frame out to every viewer without queueing.
+        Every client gets a mailbox that only holds the newest frame, and Socket.IO
+        clients have at most one frame in flight: the next one is sent when the
+        client acknowledges the last, so a slow viewer skips frames instead of
+        delaying everyone else.
+        :param socketio: The Flask-SocketIO server.
+        :param event: Event name frames are emitted under, with the frame's sequence number.
+        :param metadata_event: Event name per-frame tracking metadata is emitted under.
+        :param keepalive_event: Event name sent instead of frames while the scene is static.
+        :param ack_timeout: Seconds to wait for a client acknowledgement before sending anyway.
+        """
+        self.socketio = socketio
+        self.event = event
+        self.metadata_event = metadata_event
+        self.keepalive_event = keepalive_event
+        self.ack_timeout = ack_timeout
+        self.mailboxes = {}
+        self.lock = threading.Lock()
+        self.frames_published = 0
+        self.publish_rate = 0.0  # Frames per second handed to clients, smoothed
+        self.last_publish_time = time.time()
+        self.last_keepalive_time = 0.0
+
+    def publish(self, jpeg, seq=None, timestamp=None):
+        """Hands an encoded frame to every client. Never blocks on a client."""
+        if seq is None:
+            seq = self.frames_published
+        frame = (jpeg, seq, timestamp if timestamp is not None else time.time())
+        now = time.time()
+        if self.frames_published:
+            self.publish_rate = 0.8 * self.publish_rate + 0.2 / max(now - self.last_publish_time, 1e-6)
+        self.frames_published += 1
+        self.last_publish_time = now
+        with self.lock:
+            mailboxes = list(self.mailboxes.values())
+        for mailbox in mailboxes:
+            mailbox.put(frame)
+
+    def publish_metadata(self, metadata):
+        """
+        Sends the tracking metadata of a frame to every Socket.IO client. It is small,
+        so it goes out right away; viewers match it to frames by sequence number.
+        """
+        self.socketio.emit(self.metadata_event, metadata)
+
+    def keep_alive(self, interval=1.0):
+        """
+        Tells Socket.IO clients the stream is still up when no frame was published for
+        interval seconds, e.g. because the scene is static and encoding is skipped.
+        Cheap to call often; it only emits once per interval.
+        """
+        now = time.time()
+        if now - max(self.last_publish_time, self.last_keepalive_time) < interval:
+            return
+        self.last_keepalive_time = now
+        self.socketio.emit(self.keepalive_event, {
+            "published": self.frames_published,
+            "idle_s": round(now - self.last_publish_time, 1),
+        })
+
+    def add_mailbox(self, client_id):
+        """Registers a client that pulls frames itself (e.g. an MJPEG response)."""
+        mailbox = ClientMailbox(client_id)
+        with self.lock:
+            self.mailboxes[client_id] = mailbox
+        return mailbox
+
+    def add_socket_client(self, sid):
+        """Registers a Socket.IO client and starts its sender task."""
+        mailbox = self.add_mailbox(sid)
+        self.socketio.start_background_task(self._send_loop, mailbox)
+        return mailbox
+
+    def remove_client(self, client_id):
+        with self.lock:
+            mailbox = self.mailboxes.pop(client_id, None)
+        if mailbox is not None:
+            mailbox.close()
+
+    def _send_loop(self, mailbox):
+        acked = threading.Event()
+        while not mailbox.closed:
+            frame = mailbox.take()
+            if frame is None:
+                continue
+            acked.clear()
+            self.socketio.emit(self.event, frame[0], frame[1], to=mailbox.client_id,
+                               callback=lambda *args: acked.set())
+            if acked.wait(self.ack_timeout):
+                mailbox.delivered(frame)
+
+    def stats(self):
+        """Publish rate and per-client send rate, lag and skipped frames."""
+        with self.lock:
+            mailboxes = list(self.mailboxes.values())
+        return {
+            "published": self.frames_published,
+            "fps": round(self.publish_rate, 2),
+            "clients": {str(m.client_id): m.stats() for m in mailboxes},
+        }
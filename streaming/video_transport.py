@@ -0,0 +1,47 @@
+import itertools
+
+from flask import Response
+
+MJPEG_BOUNDARY = b"frame"
+
+_mjpeg_ids = itertools.count()
+
+
+def _mjpeg_part(jpeg):
+    # Separate chunks so the JPEG bytes are never copied into a bigger buffer
+    yield (b"--" + MJPEG_BOUNDARY + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
+           + str(len(jpeg)).encode() + b"\r\n\r\n")
+    yield jpeg
+    yield b"\r\n"
+
+
+def mjpeg_response(broadcaster, keepalive_interval=2.0):
+    """
+    multipart/x-mixed-replace response streaming frames from broadcaster.
+    The viewer gets its own mailbox, so while a slow connection is still writing
+    one frame, newer ones replace each other instead of queueing up.
+    :param keepalive_interval: Seconds without a new frame, e.g. on a static scene,
+        after which the last frame is sent again. A disconnect is only noticed when
+        a write fails, so without this a gone viewer would keep its mailbox forever.
+    """
+    mailbox = broadcaster.add_mailbox(f"mjpeg-{next(_mjpeg_ids)}")
+
+    def generate():
+        last_jpeg = None
+        try:
+            while not mailbox.closed:
+                frame = mailbox.take(timeout=keepalive_interval)
+                if frame is None:
+                    if last_jpeg is None:
+                        yield b"\r\n"  # Preamble before the first part, ignored by viewers
+                    else:
+                        yield from _mjpeg_part(last_jpeg)
+                    continue
+                last_jpeg = frame[0]
+                yield from _mjpeg_part(last_jpeg)
+                mailbox.delivered(frame)
+        finally:
+            # Runs when the viewer disconnects and the server closes the generator
+            broadcaster.remove_client(mailbox.client_id)
+
+    return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=" + MJPEG_BOUNDARY.decode())
@@ -1,6 +1,7 @@
 import streamlit as st
 import cv2
 import numpy as np
+from capture.frame_grabber import FrameGrabber
 
 text = ""
 # Initialize session state
@@ -19,6 +20,8 @@ def stop_camera():
 
 # OpenCV Video Capture
 cap = cv2.VideoCapture(0)
+grabber = FrameGrabber(cap).start()
+last_seq = -1
 
 # UI Layout for Video
 stframe = st.empty()
@@ -49,14 +52,15 @@ with st.form(key="camera_controls"):
         move_camera("Down")
 
 # Video Streaming Loop
-while cap.isOpened():
-    ret, frame = cap.read()
-    if not ret:
+while grabber.isOpened():
+    latest = grabber.wait_for_frame(newer_than=last_seq, timeout=1.0)
+    if latest is None:
         st.error("Failed to capture video")
         break
+    last_seq = latest.seq
 
     # Convert BGR (OpenCV) to RGB (Streamlit)
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    frame = cv2.cvtColor(latest.image, cv2.COLOR_BGR2RGB)
 
     # Add text overlay
     cv2.putText(
@@ -73,5 +77,5 @@ while cap.isOpened():
     # Display Video
     stframe.image(frame, channels="RGB", use_column_width=True)
 
-cap.release()
+grabber.stop()
 
@@ -0,0 +1,75 @@
+import sys
+import time
+import types
+import unittest
+
+# RPi.GPIO only exists on the Pi; record duty cycles instead of driving a pin
+_duty_log = []
+
+
+class _PWM:
+    def __init__(self, pin, frequency):
+        self.pin = pin
+
+    def start(self, duty):
+        _duty_log.append(duty)
+
+    def ChangeDutyCycle(self, duty):
+        _duty_log.append(duty)
+
+    def stop(self):
+        pass
+
+
+_gpio = types.ModuleType("RPi.GPIO")
+_gpio.BCM = _gpio.OUT = 0
+_gpio.setmode = _gpio.setup = lambda *args: None
+_gpio.cleanup = lambda: None
+_gpio.PWM = _PWM
+_rpi = types.ModuleType("RPi")
+_rpi.GPIO = _gpio
+sys.modules.setdefault("RPi", _rpi)
+sys.modules.setdefault("RPi.GPIO", _gpio)
+
+from servo.limitedServoController import LimitedServoController  # noqa: E402
+
+
+class LimitedServoControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.servo = LimitedServoController(14)
+        self.assertTrue(self.servo.wait_settled(1.0))
+        _duty_log.clear()
+
+    def tearDown(self):
+        self.servo.cleanup()
+
+    def test_stop_after_set_target_stays_near_the_step(self):
+        self.servo.set_target(100)
+        time.sleep(0.01)
+        stopped_at = self.servo.stop()
+        # A step move has no velocity to brake from, so it must not run to the end stop
+        self.assertLess(abs(stopped_at - self.servo.current_estimate()), 5.0)
+        self.assertTrue(self.servo.wait_settled(2.0))
+        self.assertLess(stopped_at, 110)
+
+    def test_slew_pre_empting_a_set_target_move_stays_in_range(self):
+        self.servo.set_target(178)
+        time.sleep(0.01)
+        self.servo.slew_to(178)
+        self.assertTrue(self.servo.wait_settled(2.0))
+        limit = LimitedServoController.duty_cycle(self.servo.max_angle)
+        self.assertTrue(all(duty <= limit + 1e-9 for duty in _duty_log), max(_duty_log))
+
+    def test_slew_pre_empting_a_slew_reverses_smoothly(self):
+        self.servo.slew_to(180)
+        time.sleep(0.3)
+        self.servo.slew_to(0)
+        self.assertTrue(self.servo.wait_settled(5.0))
+        duties = [d for d in _duty_log if d]
+        steps = [abs(b - a) for a, b in zip(duties, duties[1:])]
+        self.assertLess(max(steps), LimitedServoController.duty_cycle(10) - LimitedServoController.duty_cycle(0))
+        self.assertAlmostEqual(self.servo.current_estimate(), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
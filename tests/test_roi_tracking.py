@@ -0,0 +1,35 @@
+import unittest
+
+try:
+    import mediapipe  # noqa: F401
+except ImportError:
+    mediapipe = None
+
+
+@unittest.skipIf(mediapipe is None, "MediaPipe is not installed")
+class RoiTrackingTest(unittest.TestCase):
+    def test_crop_searches_find_the_face_on_the_synthetic_source(self):
+        from capture.frame_source import SyntheticFaceSource
+        from headtracking.mediapipe_copy import ForeheadTracking
+
+        source = SyntheticFaceSource(num_frames=120)
+        tracker = ForeheadTracking(source, roi_mode=True, draw_overlays=False, skip_static=False)
+        try:
+            errors = []
+            while not tracker.grabber.exhausted:
+                frame, _ = tracker.track_forehead()
+                if frame is not None and tracker.target_visible:
+                    x, y = tracker.kalman.position()
+                    truth_x, truth_y = source.forehead_position(tracker.last_seq)
+                    errors.append(max(abs(x - truth_x), abs(y - truth_y)))
+        finally:
+            tracker.deconstruct()
+
+        self.assertGreater(tracker.roi_attempts, 100)
+        # Nearly every crop should contain the face; a miss costs a second full-frame pass
+        self.assertGreater(tracker.roi_hits, 0.9 * tracker.roi_attempts)
+        self.assertLess(sorted(errors)[len(errors) // 2], source.face_radius)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,34 +1,75 @@
 import eventlet
 eventlet.monkey_patch()
 
-from flask import Flask, render_template
+from flask import Flask, jsonify, render_template, request
 from flask_socketio import SocketIO
-import cv2
-import base64
+import sys
 import time
 import numpy as np
 from headtracking.mediapipe_copy import ForeheadTracking  # Your class from the first part
+from streaming.adaptive_stream import AdaptiveStreamController
+from streaming.broadcaster import StreamBroadcaster
+from streaming.video_transport import mjpeg_response
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
-tracker = ForeheadTracking()
+# Leave frames clean and let the page draw the overlays from per-frame metadata
+client_overlays = "--client-overlays" in sys.argv
+tracker = ForeheadTracking(draw_overlays=not client_overlays)
+
+# Encodes once, fans out to every viewer through latest-frame mailboxes
+broadcaster = StreamBroadcaster(socketio)
+# Picks JPEG quality, scale and stream FPS from encode cost and viewer throughput
+stream_control = AdaptiveStreamController(broadcaster)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/video_feed')
+def video_feed():
+    """MJPEG stream for viewers that don't use Socket.IO (e.g. a plain <img> tag)."""
+    return mjpeg_response(broadcaster)
+
+@app.route('/stream_status')
+def stream_status():
+    """Current encoder settings plus per-viewer send rate, lag and skipped frames."""
+    status = broadcaster.stats()
+    status["encoder"] = stream_control.status()
+    return jsonify(status)
+
+@socketio.on('connect')
+def handle_connect():
+    broadcaster.add_socket_client(request.sid)
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    broadcaster.remove_client(request.sid)
+
+def publish_frame(jpeg, seq=None, timestamp=None, metadata=None):
+    """
+    Sends encoded JPEG bytes as a binary Socket.IO attachment and to MJPEG viewers.
+    With client-side overlays the frame is clean and metadata describes what to draw.
+    """
+    if metadata is not None:
+        broadcaster.publish_metadata(metadata)
+    broadcaster.publish(jpeg, seq, timestamp)
+
 def generate_video():
     while True:
-        frame, command = tracker.track_forehead()
+        frame, _ = tracker.track_forehead()
         if frame is None:
-            print("[WARN] No frame captured")
+            # No new frame yet, or the scene is static and nothing needs encoding
+            broadcaster.keep_alive()
+            eventlet.sleep(0.005)
             continue
-        if frame is not None:
-            _, buffer = cv2.imencode('.jpg', frame)
-            jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-            socketio.emit('video_stream', {'image': jpg_as_text})
-        eventlet.sleep(0.02)  # 20 FPS cap
+        if stream_control.frame_due():
+            jpeg = stream_control.encode(frame)
+            if jpeg is not None:
+                metadata = tracker.last_metadata if client_overlays else None
+                publish_frame(jpeg, tracker.last_seq, tracker.last_capture_time, metadata)
+        eventlet.sleep(0)  # Let socket events run; stream_control paces the stream
 
 if __name__ == '__main__':
     eventlet.spawn(generate_video)
@@ -1,30 +1,39 @@
 import eventlet
-eventlet.monkey_patch()
+if __name__ == "__main__":
+    # Only patch the server process. Pipeline workers are spawned processes that
+    # re-import this module as __mp_main__ and need real threads and blocking I/O.
+    eventlet.monkey_patch()
 
-import cv2
-import base64
+import sys
 import numpy as np
-from flask import Flask, render_template
+from flask import Flask, jsonify, render_template, request
 from flask_socketio import SocketIO, emit
-import threading
 import time
-from headtracking.mediapipe_copy import ForeheadTracking
+from pipeline.video_pipeline import VideoPipeline
 from servo.limitedServoController import LimitedServoController
 from servo.servo_control import ContinuousServoController
+from servo.visual_servo import VisualServoController
+from streaming.adaptive_stream import AdaptiveStreamController
+from streaming.broadcaster import StreamBroadcaster
+from streaming.video_transport import mjpeg_response
 
 last_mouse_move_time = None
 MOUSE_TIMEOUT = 0.15
 angle = 90
 video_tracking = True
+# Leave frames clean and let the page draw the overlays from per-frame metadata
+client_overlays = "--client-overlays" in sys.argv
 
 # Flask setup
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
-tracker = ForeheadTracking()
-frame_count = 0
-motorX = LimitedServoController(14)
-motorY = LimitedServoController(18)
+# Created in __main__ so spawned pipeline workers don't open the camera or GPIO
+tracker = None
+pipeline = None
+motorX = None
+motorY = None
+controller = None
 
 lastX = 0
 lastY = 0
@@ -32,10 +41,60 @@ lastY = 0
 # OpenCV video capture (Use 0 for USB camera, or change based on your setup)
 #cap = cv2.VideoCapture(0)
 
+# Encodes once, fans out to every viewer through latest-frame mailboxes
+broadcaster = StreamBroadcaster(socketio)
+# Picks JPEG quality, scale and stream FPS from encode cost and viewer throughput
+stream_control = AdaptiveStreamController(broadcaster)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/video_feed')
+def video_feed():
+    """MJPEG stream for viewers that don't use Socket.IO (e.g. a plain <img> tag)."""
+    return mjpeg_response(broadcaster)
+
+@app.route('/stream_status')
+def stream_status():
+    """Current encoder settings plus per-viewer send rate, lag and skipped frames."""
+    status = broadcaster.stats()
+    status["encoder"] = stream_control.status()
+    return jsonify(status)
+
+@app.route('/servo_status')
+def servo_status():
+    """Gains, current error and commanded angle of the turret controller per axis."""
+    return jsonify(controller.status())
+
+@socketio.on('servo_gains')
+def handle_servo_gains(data):
+    """Retunes the turret controller while running, e.g. {"axis": "pan", "kp": 3.0}."""
+    try:
+        gains = dict(data)
+        axis = gains.pop("axis", None)
+        controller.set_gains(axis, **gains)
+    except (TypeError, ValueError) as e:
+        return {"error": str(e)}
+    return controller.status()
+
+@socketio.on('connect')
+def handle_connect():
+    broadcaster.add_socket_client(request.sid)
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    broadcaster.remove_client(request.sid)
+
+def publish_frame(jpeg, seq=None, timestamp=None, metadata=None):
+    """
+    Sends encoded JPEG bytes as a binary Socket.IO attachment and to MJPEG viewers.
+    With client-side overlays the frame is clean and metadata describes what to draw.
+    """
+    if metadata is not None:
+        broadcaster.publish_metadata(metadata)
+    broadcaster.publish(jpeg, seq, timestamp)
+
 
 
 
@@ -43,18 +102,40 @@ def generate_video():
     global angle
     global video_tracking
     while True:
-        frame, command = tracker.track_forehead()
+        frame, error = tracker.track_forehead()
         if frame is None:
-            print("[WARN] No frame captured")
+            # No new frame yet, or the scene is static and nothing needs encoding
+            broadcaster.keep_alive()
+            eventlet.sleep(0.005)
             continue
-        if frame is not None:
-            _, buffer = cv2.imencode('.jpg', frame)
-            jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-            socketio.emit('video_stream', {'image': jpg_as_text})
-        if (video_tracking and command):
-            move_turret(command.split(','))
-        eventlet.sleep(0.02)  # 20 FPS cap
-
+        if stream_control.frame_due():
+            jpeg = stream_control.encode(frame)
+            if jpeg is not None:
+                metadata = tracker.last_metadata if client_overlays else None
+                publish_frame(jpeg, tracker.last_seq, tracker.last_capture_time, metadata)
+        if (video_tracking and error is not None):
+            aim_turret(error)
+        eventlet.sleep(0)  # Let socket events run; stream_control paces the stream
+
+
+def generate_video_pipelined():
+    """Forwards frames from the multi-process pipeline; the heavy work happens in the workers."""
+    while True:
+        result = pipeline.poll()
+        if result is None:
+            # Nothing new yet; static frames are dropped in the capture stage
+            broadcaster.keep_alive()
+            eventlet.sleep(0.005)
+            continue
+        if result.jpeg is not None:
+            # The encode stage only encodes at the stream rate, so every JPEG is due
+            stream_control.record(result.timings["encode_ms"] / 1000.0, len(result.jpeg))
+            pipeline.set_encoding(stream_control.quality, stream_control.scale, stream_control.fps)
+            metadata = result.metadata if client_overlays else None
+            publish_frame(result.jpeg, result.seq, result.timestamp, metadata)
+        if (video_tracking and result.error is not None):
+            aim_turret(result.error)
+        eventlet.sleep(0)
 
 
 @socketio.on('motor_control')
@@ -75,15 +156,13 @@ def handle_motor_control(data):
                 direction = "forward"
             motorX.move(direction, 0.5)
     else:
+        # Slews run on the servo's own thread, so the handler returns right away
         if state == "release":
-            #motorY.stop()
-            pass
+            motorY.stop()
+        elif direction == "down":
+            motorY.slew_to(motorY.min_angle, max_velocity=60)
         else:
-            if direction == "down":
-                direction = "backward"
-            else:
-                direction = "forward"
-            motorY.move_slowly(230, 5, 0.2)
+            motorY.slew_to(motorY.max_angle, max_velocity=60)
 
 
 @socketio.on('mouse_move')
@@ -107,8 +186,8 @@ def handle_mouse_move(data):
     lastX = data['x']
     lastY = data['y']
     print("moving")
-    motorX.move_slowly(motorX.current_angle + (difX * 5), 1, 0.05)
-    motorY.move_slowly(motorY.current_angle + (difY * 5), 1, 0.05)
+    motorX.slew_to(motorX.current_angle + (difX * 5))
+    motorY.slew_to(motorY.current_angle + (difY * 5))
 
 
     #motorX.current_angle
@@ -158,37 +237,28 @@ def stop_motor_if_idle():
             last_mouse_move_time = None
     """
 
-def move_turret(command_array):
-    global frame_count
-    frame_count += 1
-    if frame_count % 3 != 0:
-        return
-    global motorX
-    global motorY
-
-    if (command_array is None or len(command_array) <= 0):
-        return
-    if (command_array[0] == "Fire"):
+def aim_turret(error):
+    """Hands the tracker's latest measurement to the closed-loop turret controller."""
+    controller.update(error)
+    if error.on_target:
         print("Fire") # TODO: replace with actual fire logic
-        return
-    if (command_array[0] == "Left"):
-        #print("left")
-        thread_left = threading.Thread(target=motorX.set_angle, args=(motorX.current_angle - int(command_array[1]),))
-        thread_left.start()
-    elif (command_array[0] == "Right"):
-        #print("right")
-        thread_right = threading.Thread(target=motorX.set_angle, args=(motorX.current_angle + int(command_array[1]),))
-        thread_right.start()
-    if (command_array[2] == "Up"):
-        thread_up = threading.Thread(target=motorY.set_angle, args=(motorY.current_angle + int(command_array[3]),))
-        thread_up.start()
-    elif (command_array[2] == "Down"):
-        thread_down = threading.Thread(target=motorY.set_angle, args=(motorY.current_angle - int(command_array[3]),))
-        thread_down.start()
 
 
 if __name__ == "__main__":
-    eventlet.spawn(generate_video)  # Run video stream in a separate thread
+    motorX = LimitedServoController(14)
+    motorY = LimitedServoController(18)
+    # Turns the tracker's pixel error into pan/tilt targets at a fixed control rate
+    controller = VisualServoController(motorX, motorY).start()
+    if "--pipelined" in sys.argv:
+        # Capture, tracking and encoding each run in their own process
+        pipeline = VideoPipeline(draw_overlays=not client_overlays).start()
+        pipeline.set_encoding(stream_control.quality, stream_control.scale, stream_control.fps)
+        eventlet.spawn(generate_video_pipelined)
+    else:
+        # Imported here: pipeline workers re-import this module and only inference needs MediaPipe
+        from headtracking.mediapipe_copy import ForeheadTracking
+        tracker = ForeheadTracking(draw_overlays=not client_overlays)
+        eventlet.spawn(generate_video)  # Run video stream in a separate thread
     #motorX = ContinuousServoController(18)
     #motorY = LimitedServoController(23)
     eventlet.spawn(stop_motor_if_idle)